@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+
+
+def user_cache_key(user_id):
+    return f"user:{user_id}"
+
+
+def invalidate_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    # AuthenticationMiddleware loads request.user through get_user() on every
+    # request; keep the CustomUser row in the cache for USER_CACHE_TTL seconds.
+    # Saving or deleting a user and logging out drop the entry (see signals).
+    #
+    # ModelBackend stays listed after this one only so sessions that name it
+    # still load. A failed password check raises PermissionDenied, which
+    # stops authenticate() here instead of hashing the password again there.
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username, password, **kwargs)
+        if user is None and password is not None:
+            raise PermissionDenied
+        return user
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        user = await super().aauthenticate(request, username, password, **kwargs)
+        if user is None and password is not None:
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        if not settings.USER_CACHE_TTL:
+            return super().get_user(user_id)
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.USER_CACHE_TTL)
+        return user
+
+    async def aget_user(self, user_id):
+        if not settings.USER_CACHE_TTL:
+            return await super().aget_user(user_id)
+        key = user_cache_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is not None:
+                await cache.aset(key, user, settings.USER_CACHE_TTL)
+        return user
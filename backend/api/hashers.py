@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher
+
+
+class HashingOverloaded(Exception):
+    pass
+
+
+class HashingPool:
+    # A hash costs hundreds of milliseconds of CPU. At most `workers` run at
+    # once and at most `queue_depth` more may wait; past that callers are
+    # refused immediately instead of piling up behind a login storm and
+    # starving every other request on the instance.
+
+    def __init__(self, workers, queue_depth):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hash")
+        return self._executor
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingOverloaded()
+        try:
+            future = self.get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def stats(self):
+        return {"workers": self.workers, "queue_depth": self.queue_depth, "rejected": self.rejected}
+
+
+hashing_pool = HashingPool(settings.HASH_WORKERS, settings.HASH_QUEUE_DEPTH)
+
+
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    # Same algorithm name, so existing pbkdf2_sha256 hashes keep verifying
+    # and are not rehashed. verify() and harden_runtime() go through encode().
+
+    def encode(self, password, salt, iterations=None):
+        return hashing_pool.run(super().encode, password, salt, iterations)
+
+
+class PooledArgon2PasswordHasher(Argon2PasswordHasher):
+    # Needs argon2-cffi. When PASSWORD_HASHER is "argon2" this is the
+    # preferred hasher, and Django rehashes a PBKDF2 password the next time
+    # its user logs in. Changing the costs rehashes the same way.
+    time_cost = settings.ARGON2_TIME_COST
+    memory_cost = settings.ARGON2_MEMORY_COST
+    parallelism = settings.ARGON2_PARALLELISM
+
+    def encode(self, password, salt):
+        return hashing_pool.run(super().encode, password, salt)
+
+    def verify(self, password, encoded):
+        return hashing_pool.run(super().verify, password, encoded)
@@ -0,0 +1,58 @@
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a cold lambda runs before it can answer: the WSGI entry point plus
+# the URLconf, which is where netsec_website.api gets imported.
+STARTUP = (
+    "import netsec_website.wsgi; "
+    "from django.urls import get_resolver; "
+    "get_resolver().url_patterns"
+)
+
+
+def parse_importtime(stderr):
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        self_us, cumulative_us = int(fields[0]), int(fields[1])
+        modules.append((fields[2].strip(), self_us, cumulative_us))
+    return modules
+
+
+class Command(BaseCommand):
+    help = "Profile cold-start imports with -X importtime and fail over budget."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--budget-ms", type=int, default=settings.IMPORT_BUDGET_MS)
+        parser.add_argument("--top", type=int, default=15, help="Heaviest modules to list.")
+
+    def handle(self, *args, **options):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", STARTUP],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f"Startup failed:\n{result.stderr[-2000:]}")
+
+        modules = parse_importtime(result.stderr)
+        total_ms = sum(self_us for _, self_us, _ in modules) / 1000
+        for name, _, cumulative_us in sorted(modules, key=lambda m: m[2], reverse=True)[: options["top"]]:
+            self.stdout.write(f"{cumulative_us / 1000:9.1f} ms  {name}")
+
+        imported = {name for name, _, _ in modules}
+        eager = [name for name in settings.LAZY_IMPORTS if name in imported]
+        if eager:
+            raise CommandError(f"Imported at startup but should be lazy: {', '.join(eager)}")
+        if total_ms > options["budget_ms"]:
+            raise CommandError(f"Startup imports took {total_ms:.1f} ms, budget is {options['budget_ms']} ms")
+        self.stdout.write(self.style.SUCCESS(f"Startup imports took {total_ms:.1f} ms (budget {options['budget_ms']} ms)"))
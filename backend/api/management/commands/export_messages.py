@@ -0,0 +1,31 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from netsec_website.feed import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, encode_export
+
+
+class Command(BaseCommand):
+    help = "Stream every message, with author and picture, as NDJSON or a JSON array."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="-", help="Output file, - for stdout.")
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="Rows per database fetch.")
+
+    def handle(self, *args, **options):
+        output = sys.stdout.buffer if options["path"] == "-" else open(options["path"], "wb")
+        written = 0
+        start = time.perf_counter()
+        try:
+            for part in encode_export(options["chunk_size"], options["format"]):
+                output.write(part)
+                written += len(part)
+        finally:
+            if output is sys.stdout.buffer:
+                output.flush()
+            else:
+                output.close()
+        # stderr, stdout may be the export itself
+        self.stderr.write(f"Wrote {written} bytes in {time.perf_counter() - start:.2f}s")
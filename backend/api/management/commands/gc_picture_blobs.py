@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+import vercel_blob
+
+from api.models import Picture_Blob, Profile_Picture
+
+
+class Command(BaseCommand):
+    help = "Delete picture blobs that no Profile_Picture references any more."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-minutes",
+            type=int,
+            default=60,
+            help="Skip blobs used more recently than this, an upload may still be linking them.",
+        )
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options["grace_minutes"])
+        referenced = Profile_Picture.objects.filter(profile_picture=OuterRef("url"))
+        orphans = Picture_Blob.objects.filter(last_used_at__lt=cutoff).exclude(Exists(referenced))
+
+        if options["dry_run"]:
+            count = 0
+            for url in orphans.values_list("url", flat=True):
+                self.stdout.write(url)
+                count += 1
+            self.stdout.write(self.style.SUCCESS(f"Would delete {count} unreferenced blob(s)"))
+            return
+
+        deleted = 0
+        while True:
+            # Locked while they go, an upload reusing one of these waits on
+            # its last_used_at UPDATE, finds no row and uploads afresh. Rows
+            # go before blobs, a failed blob delete rolls them back.
+            with transaction.atomic():
+                batch = list(
+                    orphans.select_for_update(skip_locked=True).values_list("id", "url")[: options["batch_size"]]
+                )
+                if not batch:
+                    break
+                ids = [blob_id for blob_id, _ in batch]
+                urls = [url for _, url in batch]
+                Picture_Blob.objects.filter(id__in=ids).delete()
+                vercel_blob.delete(urls)
+            deleted += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} unreferenced blob(s)"))
@@ -0,0 +1,56 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import CustomUser
+from netsec_website.feed_cache import feed_cache
+from netsec_website.ingest import CHUNK_SIZE, IngestError, chunked, insert_chunk, invalid_rows, read_records
+
+
+class Command(BaseCommand):
+    help = "Bulk import messages from NDJSON ({\"content\": ..., \"author\": username} per line)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="-", help="NDJSON file, - for stdin.")
+        parser.add_argument("--author", help="Username for every row, overrides per-line authors.")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows per INSERT transaction.")
+        parser.add_argument("--skip-invalid", action="store_true", help="Report and skip bad rows instead of stopping.")
+
+    def handle(self, *args, **options):
+        author = None
+        if options["author"]:
+            author = CustomUser.objects.filter(username=options["author"]).first()
+            if author is None:
+                raise CommandError(f"Unknown author {options['author']}")
+
+        stream = sys.stdin.buffer if options["path"] == "-" else open(options["path"], "rb")
+        created = skipped = 0
+        start = time.perf_counter()
+        try:
+            # Each chunk commits on its own, a failure keeps earlier chunks
+            for chunk in chunked(read_records(stream), options["chunk_size"]):
+                invalid = invalid_rows(chunk)
+                if invalid:
+                    if not options["skip_invalid"]:
+                        raise CommandError(f"Invalid message on line {invalid[0]['line']}")
+                    for record in invalid:
+                        self.stderr.write(f"Skipping line {record['line']}")
+                    skipped += len(invalid)
+                    bad_lines = {record["line"] for record in invalid}
+                    chunk = [record for record in chunk if record["line"] not in bad_lines]
+                if chunk:
+                    created += insert_chunk(chunk, author=author)
+        except IngestError as e:
+            raise CommandError(f"Invalid message on {e}")
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+            if created:
+                feed_cache.invalidate()
+
+        elapsed = time.perf_counter() - start
+        rate = created / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {created} message(s), skipped {skipped}, in {elapsed:.2f}s ({rate:.0f} rows/s)"
+        ))
@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import Upload_Job
+from netsec_website.uploads import STALE_AFTER, process_job
+
+
+class Command(BaseCommand):
+    help = "Process pending profile picture upload jobs in this process."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--stale-minutes",
+            type=int,
+            default=int(STALE_AFTER.total_seconds() // 60),
+            help="Requeue PROCESSING jobs not updated for this long.",
+        )
+
+    def handle(self, *args, **options):
+        Upload_Job.objects.filter(
+            status=Upload_Job.PROCESSING,
+            updated_at__lt=timezone.now() - timedelta(minutes=options["stale_minutes"]),
+        ).update(status=Upload_Job.PENDING)
+
+        processed = 0
+        for job_id in Upload_Job.objects.filter(status=Upload_Job.PENDING).values_list("id", flat=True):
+            process_job(job_id)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} upload job(s)"))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 11:00
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_alter_message_content'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Picture_Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True, validators=[django.core.validators.ProhibitNullCharactersValidator, django.core.validators.RegexValidator(message='Content hash must be a sha256 hex digest.', regex='^[0-9a-f]{64}$')])),
+                ('url', models.CharField(max_length=500, validators=[django.core.validators.URLValidator(schemes=['https']), django.core.validators.ProhibitNullCharactersValidator, django.core.validators.MaxLengthValidator(500), django.core.validators.MinLengthValidator(1)])),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
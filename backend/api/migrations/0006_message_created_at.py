@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-18 11:13
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_upload_job'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='message',
+            options={'ordering': ['id']},
+        ),
+        # Existing rows all get the migration time, id still orders them
+        migrations.AddField(
+            model_name='message',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        # Before dropping the FK's own index, so author lookups are never unindexed
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['author', '-id'], name='message_author_idx'),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['-created_at'], name='message_created_at_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-18 11:32
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# Postgres only, SQLite searches through netsec_website.search's in-process index
+def install_search(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # Backfill first, building the GIN index over a filled column is cheaper
+    schema_editor.execute(
+        "UPDATE api_message SET search_vector = to_tsvector('pg_catalog.english', content)"
+    )
+    schema_editor.execute(
+        "CREATE INDEX message_search_idx ON api_message USING gin (search_vector)"
+    )
+    # Covers save(), bulk_create() and raw SQL alike
+    schema_editor.execute(
+        "CREATE TRIGGER message_search_update BEFORE INSERT OR UPDATE OF content ON api_message "
+        "FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.english', content)"
+    )
+
+
+def remove_search(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP TRIGGER IF EXISTS message_search_update ON api_message")
+    schema_editor.execute("DROP INDEX IF EXISTS message_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_message_created_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(install_search, remove_search),
+    ]
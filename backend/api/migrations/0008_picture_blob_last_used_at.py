@@ -0,0 +1,20 @@
+# Generated by Django 5.2 on 2026-10-18 11:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_message_search'),
+    ]
+
+    operations = [
+        # Existing rows get the migration time, a fresh grace window for all
+        migrations.AddField(
+            model_name='picture_blob',
+            name='last_used_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,7 +1,10 @@
 import uuid
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import AbstractUser
 from django.core import validators
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 
 class CustomUser(AbstractUser):
@@ -22,6 +25,19 @@ class CustomUser(AbstractUser):
         self.full_clean()
         super().save(*args, **kwargs)
 
+class MessageManager(models.Manager):
+    def create_validated(self, content, author):
+        # For content that already passed the MessageIn schema (alphanumeric
+        # and spaces, so non-empty, no NUL, matches the model regex). Only
+        # the length limit is left to check; author is the session user and
+        # uuid uniqueness is enforced by the DB index, so full_clean()'s FK
+        # and validate_unique SELECTs are skipped.
+        if len(content) > Message._meta.get_field('content').max_length:
+            raise ValidationError({'content': 'Ensure this value has at most 255 characters.'})
+        message = self.model(content=content, author=author)
+        message.save(validate=False, force_insert=True)
+        return message
+
 class Message(models.Model):
     id = models.AutoField(primary_key=True, validators = [
         validators.MinValueValidator(1),
@@ -41,13 +57,34 @@ class Message(models.Model):
             message='Content can only contain letters, numbers, and spaces.'
         ),
     ])
-    author = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    # Indexed through message_author_idx instead of on its own
+    author = models.ForeignKey(CustomUser, on_delete=models.CASCADE, db_index=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Postgres only: filled by the message_search_update trigger, on every
+    # insert including bulk_create, and indexed by message_search_idx (see
+    # migration 0007). Stays NULL on SQLite.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = MessageManager()
+
+    class Meta:
+        # id comes from the sequence, so it is insertion order and never ties;
+        # the feed pages on it through the primary key index
+        ordering = ['id']
+        indexes = [
+            # A user's messages newest first, also serves the FK and cascades
+            models.Index(fields=['author', '-id'], name='message_author_idx'),
+            # Time-range reads over the history
+            models.Index(fields=['-created_at'], name='message_created_at_idx'),
+        ]
 
     def __str__(self):
         return self.title
     
-    def save(self, *args, **kwargs):
-        self.full_clean()
+    def save(self, *args, validate=True, **kwargs):
+        # validate=False is only for Message.objects.create_validated
+        if validate:
+            self.full_clean()
         super().save(*args, **kwargs)
 
 class Profile_Picture(models.Model):
@@ -65,3 +102,57 @@ class Profile_Picture(models.Model):
     def save(self, *args, **kwargs):
         self.full_clean()
         super().save(*args, **kwargs)
+
+class Picture_Blob(models.Model):
+    # Content-addressed index of uploaded pictures, one row per distinct PNG
+    content_hash = models.CharField(max_length=64, unique=True, validators = [
+        validators.ProhibitNullCharactersValidator,
+        validators.RegexValidator(
+            regex=r'^[0-9a-f]{64}$',
+            message='Content hash must be a sha256 hex digest.'
+        ),
+    ])
+    url = models.CharField(max_length=500, validators = [
+        validators.URLValidator(schemes=['https']),
+        validators.ProhibitNullCharactersValidator,
+        validators.MaxLengthValidator(500),
+        validators.MinLengthValidator(1),
+    ])
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Touched whenever an upload reuses the blob, the GC grace window runs from here
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.content_hash
+
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        super().save(*args, **kwargs)
+
+class Upload_Job(models.Model):
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    # Raw upload, cleared once the job finishes
+    data = models.BinaryField(blank=True, null=True)
+    error = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return str(self.id)
+
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        super().save(*args, **kwargs)
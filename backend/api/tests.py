@@ -0,0 +1,445 @@
+import asyncio
+from datetime import timedelta
+from io import BytesIO, StringIO
+import struct
+import time
+from unittest import mock, skipUnless
+
+from django.contrib.auth import authenticate
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from ninja.conf import settings as ninja_settings
+from PIL import Image, ImageCms
+from PIL.PngImagePlugin import PngInfo
+
+from netsec_website.events import event_stream, event_stream_response, message_hub
+from netsec_website.feed import feed_queryset
+from netsec_website.feed_cache import feed_cache
+from netsec_website.images import sanitize_image
+from netsec_website.ratelimit import MemoryBuckets, RateLimiter
+from netsec_website.search import InvertedIndex
+from netsec_website.uploads import enqueue, process_job, set_profile_picture, store_picture, STALE_AFTER
+
+from .models import CustomUser, Message, Picture_Blob, Profile_Picture, Upload_Job
+
+
+# The REDIS_URL deployment: sessions and users come from the shared cache,
+# so a warm request costs no query before the view's own
+shared_cache_sessions = override_settings(
+    SESSION_ENGINE="django.contrib.sessions.backends.cached_db",
+    USER_CACHE_TTL=60,
+)
+
+
+def make_user(username, picture=None):
+    user = CustomUser(username=username)
+    user.set_unusable_password()
+    user.save()
+    if picture:
+        Profile_Picture.objects.create(user=user, profile_picture=picture)
+    return user
+
+
+@shared_cache_sessions
+class FeedQueryTests(TestCase):
+    def setUp(self):
+        feed_cache.invalidate()
+        self.alice = make_user("alice", "https://blob.example/alice.png")
+        self.bob = make_user("bob")
+        self.client.force_login(self.alice)
+        # Loads request.user into the user cache, so only the feed is counted
+        self.client.get("/api/session", secure=True)
+
+    def add_messages(self, count):
+        Message.objects.bulk_create(
+            Message(content=f"message {i}", author=self.alice if i % 2 else self.bob)
+            for i in range(count)
+        )
+        feed_cache.invalidate()
+
+    def test_feed_is_one_query_whatever_the_message_count(self):
+        for count in (1, 49):
+            self.add_messages(count)
+            with self.assertNumQueries(1):
+                response = self.client.get("/api/message", secure=True)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 50)
+
+    def test_unchanged_feed_is_a_304_without_queries(self):
+        self.add_messages(3)
+        etag = self.client.get("/api/message", secure=True)["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/message", secure=True, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 304)
+        # Any write changes the tag
+        self.add_messages(1)
+        response = self.client.get("/api/message", secure=True, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_invalid_row_is_dropped_not_the_page(self):
+        self.add_messages(2)
+        # Bypasses validation, like a row written before it was tightened
+        Message.objects.bulk_create([Message(content="hello\n", author=self.bob)])
+        feed_cache.invalidate()
+        response = self.client.get("/api/message", secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m["content"] for m in response.json()], ["message 0", "message 1"])
+
+    def test_trailing_newline_is_rejected_on_input(self):
+        response = self.client.post(
+            "/api/message", {"content": "hello\n"}, content_type="application/json", secure=True,
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Message.objects.exists())
+
+
+class EventStreamTests(TestCase):
+    def test_events_are_501_under_wsgi(self):
+        self.client.force_login(make_user("alice"))
+        response = self.client.get("/api/events", secure=True)
+        self.assertEqual(response.status_code, 501)
+
+    async def test_subscription_lives_exactly_as_long_as_the_stream(self):
+        # Built but never iterated, like a client gone before the first byte
+        event_stream_response()
+        self.assertFalse(message_hub.has_subscribers())
+        stream = event_stream()
+        self.assertEqual(await anext(stream), "retry: 3000\n\n")
+        self.assertTrue(message_hub.has_subscribers())
+        await stream.aclose()
+        self.assertFalse(message_hub.has_subscribers())
+
+
+class LoginTests(TestCase):
+    def test_failed_login_hashes_the_password_once(self):
+        user = CustomUser(username="alice")
+        user.set_password("correct horse")
+        user.save()
+        with mock.patch.object(CustomUser, "check_password", autospec=True, return_value=False) as check:
+            self.assertIsNone(authenticate(username="alice", password="wrong"))
+        self.assertEqual(check.call_count, 1)
+        self.assertEqual(authenticate(username="alice", password="correct horse"), user)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        feed_cache.invalidate()
+        # A fresh fallback index, ids are reused between rolled back tests
+        patcher = mock.patch("netsec_website.search.inverted_index", InvertedIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        author = make_user("alice")
+        self.client.force_login(author)
+        for content in ("hello world", "hello there", "world hello", "goodbye world"):
+            Message.objects.create(content=content, author=author)
+        feed_cache.invalidate()
+
+    def search(self, q):
+        response = self.client.get("/api/message/search", {"q": q}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        return sorted(message["content"] for message in response.json())
+
+    def test_exclusions_and_phrases(self):
+        self.assertEqual(self.search("hello -world"), ["hello there"])
+        self.assertEqual(self.search('"hello world"'), ["hello world"])
+        self.assertEqual(self.search('world -"hello world"'), ["goodbye world", "world hello"])
+
+    def test_deleted_messages_leave_the_index(self):
+        self.assertEqual(self.search("goodbye"), ["goodbye world"])
+        Message.objects.filter(content="goodbye world").delete()
+        feed_cache.invalidate()
+        self.assertEqual(self.search("goodbye"), [])
+        self.assertEqual(self.search("world"), ["hello world", "world hello"])
+
+
+class RateLimitTests(TestCase):
+    def test_denied_request_spends_from_no_bucket(self):
+        buckets = MemoryBuckets()
+        limits = [("global", 0.001, 3), ("ip:1", 0.001, 1)]
+        self.assertFalse(any(buckets.take(limits, 1)))
+        self.assertTrue(buckets.take(limits, 1)[1])
+        # Both global tokens the denied request was checked against are left
+        self.assertFalse(any(buckets.take([("global", 0.001, 3)], 2)))
+
+    def test_cost_above_burst_is_clamped(self):
+        self.assertFalse(any(MemoryBuckets().take([("ip:1", 1, 5)], 50)))
+
+    def spoofed_requests(self, last_hop):
+        limiter = RateLimiter(MemoryBuckets(), {
+            "USER_RATE": 1, "USER_BURST": 1, "IP_RATE": 0.001, "IP_BURST": 1,
+            "GLOBAL_RATE": 1000, "GLOBAL_BURST": 1000,
+        })
+        factory = RequestFactory()
+        return [
+            limiter.check(factory.get("/", REMOTE_ADDR="203.0.113.7", HTTP_X_FORWARDED_FOR=f"10.0.0.{i}{last_hop}"), 1)
+            for i in range(3)
+        ]
+
+    def test_spoofed_forwarded_for_gets_no_fresh_bucket(self):
+        # No proxy configured: the header is ignored, REMOTE_ADDR is the key
+        allowed, *denied = self.spoofed_requests("")
+        self.assertIsNone(allowed)
+        self.assertEqual([response.status_code for response in denied], [429, 429])
+
+    def test_behind_a_proxy_only_its_entry_counts(self):
+        with mock.patch.object(ninja_settings, "NUM_PROXIES", 1):
+            allowed, *denied = self.spoofed_requests(", 198.51.100.9")
+        self.assertIsNone(allowed)
+        self.assertEqual([response.status_code for response in denied], [429, 429])
+
+
+class PictureBlobTests(TestCase):
+    HASH = "a" * 64
+
+    def old_blob(self):
+        long_ago = timezone.now() - timedelta(days=1)
+        blob = Picture_Blob.objects.create(content_hash=self.HASH, url="https://blob.example/old.png")
+        Picture_Blob.objects.filter(id=blob.id).update(created_at=long_ago, last_used_at=long_ago)
+        return blob
+
+    def test_reused_blob_survives_gc(self):
+        self.old_blob()
+        with mock.patch("netsec_website.uploads.hashlib.sha256") as sha256, mock.patch("vercel_blob.delete") as delete:
+            sha256.return_value.hexdigest.return_value = self.HASH
+            self.assertEqual(store_picture(b"png"), "https://blob.example/old.png")
+            call_command("gc_picture_blobs", stdout=StringIO())
+        delete.assert_not_called()
+        self.assertTrue(Picture_Blob.objects.filter(content_hash=self.HASH).exists())
+
+    def test_losing_the_insert_race_drops_our_blob(self):
+        def put(path, data, options):
+            # The same picture lands from another worker mid-upload
+            Picture_Blob.objects.create(content_hash=self.HASH, url="https://blob.example/theirs.png")
+            return {"downloadUrl": "https://blob.example/ours.png"}
+
+        with mock.patch("netsec_website.uploads.hashlib.sha256") as sha256, \
+                mock.patch("vercel_blob.put", side_effect=put), mock.patch("vercel_blob.delete") as delete:
+            sha256.return_value.hexdigest.return_value = self.HASH
+            self.assertEqual(store_picture(b"png"), "https://blob.example/theirs.png")
+        delete.assert_called_once_with("https://blob.example/ours.png")
+
+
+class IndexUsageTests(TestCase):
+    def setUp(self):
+        self.alice = make_user("alice")
+        Message.objects.bulk_create(Message(content=f"message {i}", author=self.alice) for i in range(20))
+
+    def plan(self, queryset):
+        if connection.vendor == "postgresql":
+            # A few rows are cheaper to scan, only ask whether the index fits
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        return queryset.explain()
+
+    def test_per_author_page_uses_author_index(self):
+        plan = self.plan(feed_queryset().filter(author=self.alice).order_by("-id")[:50])
+        self.assertIn("message_author_idx", plan)
+
+    def test_time_range_uses_created_at_index(self):
+        since = timezone.now() - timedelta(days=1)
+        plan = self.plan(feed_queryset().filter(created_at__gte=since).order_by("-created_at")[:50])
+        self.assertIn("message_created_at_idx", plan)
+
+    def test_feed_page_walks_the_primary_key(self):
+        plan = self.plan(feed_queryset().order_by("-id")[:50])
+        # Never sorts the table for a page
+        self.assertNotIn("TEMP B-TREE", plan)
+        self.assertNotIn("Sort", plan)
+
+    @skipUnless(connection.vendor == "postgresql", "Postgres plan format")
+    def test_feed_page_is_an_index_scan_on_postgres(self):
+        plan = self.plan(feed_queryset().order_by("-id")[:50])
+        self.assertIn("Index Scan Backward using api_message_pkey", plan)
+
+
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        self.client.force_login(make_user("alice"))
+
+    def test_off_by_default(self):
+        self.assertNotIn("Server-Timing", self.client.get("/api/message", secure=True))
+
+    def test_staff_only(self):
+        with self.settings(SERVER_TIMING="staff"):
+            self.assertNotIn("Server-Timing", self.client.get("/api/message", secure=True))
+            staff = make_user("bob")
+            CustomUser.objects.filter(pk=staff.pk).update(is_staff=True)
+            self.client.force_login(CustomUser.objects.get(pk=staff.pk))
+            self.assertIn("Server-Timing", self.client.get("/api/message", secure=True))
+
+
+class SessionTests(TestCase):
+    def test_deleted_session_is_logged_out(self):
+        # Default settings, no shared cache: nothing may outlive the row
+        self.client.force_login(make_user("alice"))
+        self.assertEqual(self.client.get("/api/session", secure=True).status_code, 200)
+        Session.objects.all().delete()
+        self.assertEqual(self.client.get("/api/session", secure=True).status_code, 401)
+
+
+def png_chunks(data):
+    chunks, position = [], 8
+    while position < len(data):
+        length, kind = struct.unpack(">I4s", data[position:position + 8])
+        chunks.append(kind.decode())
+        position += 12 + length
+    return chunks
+
+
+def encode(image, format, **params):
+    buffer = BytesIO()
+    image.save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+
+class SanitizeImageTests(TestCase):
+    def assertClean(self, data):
+        output = sanitize_image(data)
+        self.assertIsNotNone(output)
+        self.assertEqual(set(png_chunks(output)), {"IHDR", "IDAT", "IEND"})
+        with Image.open(BytesIO(output)) as image:
+            self.assertEqual((image.format, image.size, image.mode), ("PNG", (64, 64), "RGB"))
+
+    def test_jpeg_exif_is_dropped(self):
+        exif = Image.Exif()
+        exif[0x010F] = "Camera maker"
+        exif[0x8825] = {2: (48.0, 51.0, 30.0)}
+        self.assertClean(encode(Image.new("RGB", (300, 200), "red"), "JPEG", exif=exif))
+
+    def test_png_text_and_icc_are_dropped_in_every_mode(self):
+        info = PngInfo()
+        info.add_text("Comment", "<script>alert(1)</script>")
+        info.add_text("Author", "someone", zip=True)
+        icc = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+        for mode in ("P", "LA", "I;16", "RGBA"):
+            with self.subTest(mode=mode):
+                data = encode(Image.new(mode, (100, 80)), "PNG", pnginfo=info, icc_profile=icc)
+                self.assertTrue({"tEXt", "zTXt", "iCCP"} <= set(png_chunks(data)))
+                self.assertClean(data)
+
+    def test_oversized_dimensions_are_refused(self):
+        self.assertIsNone(sanitize_image(encode(Image.new("1", (4097, 4096)), "PNG")))
+
+    def test_truncated_and_corrupt_input_is_refused(self):
+        data = encode(Image.effect_noise((64, 64), 50).convert("RGB"), "PNG")
+        corrupt = data[:40] + bytes(len(data) - 52) + data[-12:]
+        for broken in (data[:len(data) // 2], corrupt, b"not an image"):
+            with self.subTest(length=len(broken)):
+                self.assertIsNone(sanitize_image(broken))
+
+
+@shared_cache_sessions
+class WriteQueryTests(TestCase):
+    def setUp(self):
+        feed_cache.invalidate()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.client.force_login(self.alice)
+        # Warms the session and user caches, only the write is counted
+        self.client.get("/api/session", secure=True)
+
+    def test_create_message_is_one_insert(self):
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                "/api/message", {"content": "hello"}, content_type="application/json", secure=True,
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Message.objects.get().author, self.alice)
+
+    def test_delete_message_is_one_delete(self):
+        message = Message.objects.create(content="hello", author=self.alice)
+        with self.assertNumQueries(1):
+            response = self.client.delete(f"/api/message/{message.uuid}", secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Message.objects.exists())
+
+    def test_deleting_someone_elses_message_deletes_nothing(self):
+        message = Message.objects.create(content="hello", author=self.bob)
+        with self.assertNumQueries(1):
+            response = self.client.delete(f"/api/message/{message.uuid}", secure=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(Message.objects.filter(id=message.id).exists())
+
+    def test_profile_picture_upsert_is_one_statement(self):
+        with self.assertNumQueries(1):
+            set_profile_picture(self.alice.id, "https://blob.example/first.png")
+        with self.assertNumQueries(1):
+            set_profile_picture(self.alice.id, "https://blob.example/second.png")
+        self.assertEqual(
+            list(Profile_Picture.objects.values_list("user_id", "profile_picture")),
+            [(self.alice.id, "https://blob.example/second.png")],
+        )
+
+
+class UploadJobTests(TestCase):
+    def setUp(self):
+        self.alice = make_user("alice")
+        self.client.force_login(self.alice)
+        # Jobs run right here in the test instead of on the upload workers
+        self.submit = mock.Mock()
+        for target in ("netsec_website.uploads.submit", "netsec_website.api.submit"):
+            patcher = mock.patch(target, self.submit)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_upload_becomes_the_profile_picture(self):
+        job = enqueue(self.alice, encode(Image.new("RGB", (200, 200), "blue"), "PNG"))
+        self.submit.assert_called_with(job.id)
+        with mock.patch("vercel_blob.put", return_value={"downloadUrl": "https://blob.example/blue.png"}):
+            process_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.data), (Upload_Job.DONE, None))
+        self.assertEqual(Profile_Picture.objects.get(user=self.alice).profile_picture, "https://blob.example/blue.png")
+
+    def test_invalid_image_fails_the_job(self):
+        job = enqueue(self.alice, b"\x89PNG\r\n\x1a\n" + b"garbage" * 10)
+        with mock.patch("vercel_blob.put") as put:
+            process_job(job.id)
+        put.assert_not_called()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (Upload_Job.FAILED, "Invalid file"))
+        self.assertFalse(Profile_Picture.objects.exists())
+
+    def test_status_requeues_a_job_orphaned_in_processing(self):
+        job = Upload_Job.objects.create(user=self.alice, data=b"png", status=Upload_Job.PROCESSING)
+        Upload_Job.objects.filter(id=job.id).update(updated_at=timezone.now() - STALE_AFTER - timedelta(seconds=1))
+        response = self.client.get(f"/api/upload/{job.id}", secure=True)
+        self.assertEqual(response.json()["status"], Upload_Job.PENDING)
+        self.submit.assert_called_once_with(job.id)
+
+    def test_status_leaves_a_running_job_alone(self):
+        job = Upload_Job.objects.create(user=self.alice, data=b"png", status=Upload_Job.PROCESSING)
+        response = self.client.get(f"/api/upload/{job.id}", secure=True)
+        self.assertEqual(response.json()["status"], Upload_Job.PROCESSING)
+        self.submit.assert_not_called()
+
+
+class SlopConcurrencyTests(TestCase):
+    # Stubbed upstream: each Groq call takes UPSTREAM_SECONDS. A worker that
+    # serves one request at a time, like a sync view on one WSGI thread,
+    # needs CONCURRENT * UPSTREAM_SECONDS for the burst; the async view must
+    # overlap the calls.
+    UPSTREAM_SECONDS = 0.2
+    CONCURRENT = 5
+
+    def slow_generate(self):
+        time.sleep(self.UPSTREAM_SECONDS)
+        return "tralalero tralala"
+
+    async def test_ai_slop_calls_overlap(self):
+        user = await CustomUser.objects.acreate(username="alice", password="!")
+        await self.async_client.aforce_login(user)
+        with mock.patch("netsec_website.api.generate_name", self.slow_generate), \
+                mock.patch("netsec_website.api.slop_pool.take_nowait", return_value=None), \
+                mock.patch("netsec_website.api.limiter.check", return_value=None):
+            start = time.perf_counter()
+            responses = await asyncio.gather(*(
+                self.async_client.get("/api/ai_slop", secure=True) for _ in range(self.CONCURRENT)
+            ))
+            elapsed = time.perf_counter() - start
+        self.assertEqual([response.status_code for response in responses], [200] * self.CONCURRENT)
+        self.assertLess(elapsed, self.CONCURRENT * self.UPSTREAM_SECONDS / 2)
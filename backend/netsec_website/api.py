@@ -2,44 +2,60 @@
 from ninja import NinjaAPI
 from ninja import Schema
 from ninja import UploadedFile, File
-from ninja.security import django_auth
+from ninja import Query
+from ninja.security import django_auth, django_auth_superuser
 from ninja.errors import ValidationError as NinjaValidationError
 # django
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
-from django.http import HttpResponse
-from django.middleware.csrf import get_token
+from django.http import HttpResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token, rotate_token
 from django.contrib.auth import authenticate, login, logout
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.core.exceptions import ValidationError
-from .settings import GROQ_API_KEY
+from asgiref.sync import sync_to_async
 # pydantic
 from pydantic import ValidationError, field_validator
 #api
-from api.models import Message, Profile_Picture, CustomUser
+from api.models import Message, CustomUser, Upload_Job
+from api.hashers import HashingOverloaded, hashing_pool
+from .feed import render_feed, encode_rows, encode_export, FEED_PAGE_SIZE, FEED_MAX_PAGE_SIZE, EXPORT_FORMATS
+from .search import search_messages, SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE, SEARCH_MAX_OFFSET
+from .renderers import ORJSONRenderer
+from .feed_cache import feed_cache
+from .events import event_stream_response, streaming_supported, publish_message_created, publish_message_deleted
+from .auth import async_django_auth
+from .slop import slop_pool, generate_name
+from .uploads import enqueue, requeue_stale, submit
+from .sniff import sniff_mime, ALLOWED_MIME_TYPES
+from .instrumentation import registry
+from .conditional import conditional_response, body_etag
+from .ratelimit import rate_limit, limiter
+from .ingest import read_records, invalid_rows, chunked, insert_chunk, IngestError, CHUNK_SIZE
 # python
+from datetime import datetime
 import re
-import vercel_blob
-from typing import List
-from io import BytesIO
+import orjson
+from itertools import islice
+from typing import List, Optional
 import uuid
-# Pillow
-from PIL import Image, UnidentifiedImageError
-# Python magic
-import magic
-#Groq
-from groq import Groq
 # Logging
 import logging
 logger = logging.getLogger(__name__)
 
 # 5 KB
 MAX_FILE_SIZE = 5 * 1024
+# POST /message/batch caps
+MAX_BATCH_MESSAGES = 1000
+MAX_BATCH_BYTES = 512 * 1024
 
 SLUG = re.compile(r'^[a-zA-Z0-9-_]+$')
-ALNUMERIC_SPACE = re.compile(r'^[a-zA-Z0-9 ]+$')
+# Words plus websearch's "phrase" and -exclusion syntax
+SEARCH_QUERY = re.compile(r'^[a-zA-Z0-9 "-]+$')
+# \Z, not $, which would also match before a trailing newline
+ALNUMERIC_SPACE = re.compile(r'^[a-zA-Z0-9 ]+\Z')
 
 
-api = NinjaAPI(csrf=True, auth=django_auth)
+api = NinjaAPI(csrf=True, auth=django_auth, renderer=ORJSONRenderer())
 
 @api.exception_handler(NinjaValidationError)
 def custom_validation_error_handler(request, exc):
@@ -88,6 +104,7 @@ class MessageOut(Schema):
     content: str
     author: str
     profile_picture: str
+    created_at: datetime
 
     @field_validator('uuid')
     def slug(cls, v):
@@ -104,6 +121,29 @@ class MessageOut(Schema):
         assert v.isalnum(), 'must be alphanumeric'
         return v
 
+class UploadJobOut(Schema):
+    job_id: str
+    status: str
+    details: str
+
+    @field_validator('job_id')
+    def slug(cls, v):
+        assert SLUG.match(v), 'must be slug'
+        return v
+
+    @field_validator('status')
+    def alphanumeric(cls, v):
+        assert v.isalnum(), 'must be alphanumeric'
+        return v
+
+    @field_validator('details')
+    def alphanumeric_space(cls, v):
+        assert v == '' or ALNUMERIC_SPACE.match(v), 'must be alphanumeric or space'
+        return v
+
+class BatchOut(Schema):
+    created: int
+
 class ReturnMessage(Schema):
     message: str
 
@@ -130,40 +170,55 @@ def get_csrf_token(request):
     except Exception as e:
         logger.error(f"CSRF token generation failed: {e}")
 
-@api.post("/login", response={200: ReturnMessage, 401: ReturnError}, auth=None)
-def login_user(request, payload: UserIn):
+@api.post("/login", response={200: ReturnMessage, 401: ReturnError, 503: ReturnError}, auth=None)
+@rate_limit(cost=2)
+def login_user(request, response: HttpResponse, payload: UserIn):
     try:
         user = authenticate(username=payload.username, password=payload.password)
         if user is not None:
+            # login() rotates the CSRF token, hand the new one back with the cookie
             login(request, user)
+            response["X-CSRFToken"] = get_token(request)
             return 200, {"message": "Login successful"}
+    except HashingOverloaded:
+        response["Retry-After"] = "1"
+        return 503, {"details": "Server busy"}
     except Exception as e:
         logger.exception(f"Login failed: {e}")
         return 401, {"details": "Invalid credentials"}
     return 401, {"details": "Invalid credentials"}
 
 @api.post("/logout", response={200: ReturnMessage, 400: ReturnError})
-def logout_user(request):
+def logout_user(request, response: HttpResponse):
     try:
         logout(request)
+        rotate_token(request)
+        response["X-CSRFToken"] = get_token(request)
     except Exception as e:
         logger.exception(f"Logout failed: {e}")
         return 400, {"details": "Logout failed"}
     return 200, {"message": "Logout successful"}
 
-@api.get("/session", response={200: UserOut, 401: ReturnError})
+@api.get("/session", response={200: UserOut, 401: ReturnError}, auth=None)
 def session_status(request):
+    # Every page load starts here, so it also plants the csrftoken cookie
+    # the frontend reads before writes
+    if "CSRF_COOKIE" not in request.META:
+        get_token(request)
     try:
         if request.user.is_authenticated:
-            return 200, {"username": f"{request.user.username}", "id": str(request.user.id)}
+            user = {"username": f"{request.user.username}", "id": str(request.user.id)}
+            body = orjson.dumps(user)
+            return conditional_response(request, body_etag(body), lambda: body)
     except Exception as e:
         logger.exception(f"Session status check failed: {e}")
         return 401, {"details": "User is not logged in"}
     return 401, {"details": "User is not logged in"}
 
 
-@api.post("/user", response={200:ReturnMessage, 400: ReturnError}, auth=None)
-def create_user(request, payload: UserIn):
+@api.post("/user", response={200:ReturnMessage, 400: ReturnError, 503: ReturnError}, auth=None)
+@rate_limit(cost=5)
+def create_user(request, response: HttpResponse, payload: UserIn):
     try:
         user = CustomUser(username=payload.username)
         user.set_password(payload.password)
@@ -174,6 +229,9 @@ def create_user(request, payload: UserIn):
         return 400, {"details": "User creation failed"}
     except ValidationError as e:
         return 400, {"details": "User creation failed"}
+    except HashingOverloaded:
+        response["Retry-After"] = "1"
+        return 503, {"details": "Server busy"}
     except Exception as e:
         logger.exception(f"User creation failed: {e}")
         return 400, {"details": "User creation failed"}
@@ -209,8 +267,10 @@ def create_user(request, payload: UserIn):
 #         return 500, {"details": "User deletion failed"}
 #     return 200, {"message": "User deleted successfully"}
 
-@api.post("/upload", response={200:ReturnMessage, 400:ReturnError})
+@api.post("/upload", response={202: UploadJobOut, 400: ReturnError})
+@rate_limit(cost=5)
 def upload_profile_picture(request, file: UploadedFile = File(...)):
+    # Only the cheap checks run here, decoding and storing happen in the upload workers
     try:
         # file name check:
         if '0x00' in file.name:
@@ -236,62 +296,46 @@ def upload_profile_picture(request, file: UploadedFile = File(...)):
             return 400, {"details": "File is empty"}
         if len(file_data) > MAX_FILE_SIZE:
             return 400, {"details": "File too large"}
-        
-        # Check MIME with python-magic
-        mime = magic.Magic(mime=True)
-        mimetype = mime.from_buffer(file_data)
-        if mimetype not in ['image/jpeg', 'image/png']:
-            return 400, {"details": "Invalid file"}
-        # Validate content
-        try:
-            # Strip metadata
-            raw_img = Image.open(BytesIO(file_data))
-            image_format = raw_img.format
-            raw_img.verify()  # validate file integrity
-            if image_format not in ['JPEG', 'PNG']:
-                return 400, {"details": "Invalid file"}
-            
-            raw_img = Image.open(BytesIO(file_data))
-            data = list(raw_img.getdata())
-            img = Image.new(raw_img.mode, raw_img.size)
-            img.putdata(data)
-            
-        except UnidentifiedImageError:
-            return 400, {"details": "Invalid file"}
-        except Exception:
-            logger.exception("Image metadata strip failed: {e}")
+        # Signature check is a prefix compare for real JPEG/PNG, reject junk before queueing
+        if sniff_mime(file_data) not in ALLOWED_MIME_TYPES:
             return 400, {"details": "Invalid file"}
 
-        # Sanitize image
-        img = img.convert("RGB")  
-        img = img.resize((64, 64))
-
-        safe_buffer = BytesIO()
-        img.save(safe_buffer, format="PNG") 
-        safe_buffer.seek(0)
-
-        user = CustomUser.objects.get(id=request.user.id)
-        file_uuid = str(uuid.uuid4())
-        uploaded_file = vercel_blob.put(f'{file_uuid}', safe_buffer.read(), {})
-        profile_picture, created = Profile_Picture.objects.get_or_create(user=user)
-        profile_picture.profile_picture = uploaded_file['downloadUrl']
-        profile_picture.save()
-        return 200, {"message": "Image uploaded successfully"}
+        job = enqueue(request.user, file_data)
+        return 202, {"job_id": str(job.id), "status": job.status, "details": ""}
     except ValidationError:
         return 400, {"details": "Image upload failed"}
     except Exception as e:
         logger.exception(f"Image upload failed: {e}")
         return 400, {"details": "Image upload failed"}
 
+@api.get("/upload/{job_id}", response={200: UploadJobOut, 404: ReturnError})
+def upload_status(request, job_id: uuid.UUID):
+    try:
+        job = Upload_Job.objects.filter(id=job_id, user_id=request.user.id).values_list('status', 'error').first()
+        if job is None:
+            return 404, {"details": "Upload not found"}
+        status, error = job
+        # The instance processing it may have been killed or recycled
+        if status == Upload_Job.PROCESSING and requeue_stale(Upload_Job.objects.filter(id=job_id)):
+            status = Upload_Job.PENDING
+        if status == Upload_Job.PENDING:
+            # Serverless workers may have been frozen, make sure someone owns it
+            submit(job_id)
+    except Exception as e:
+        logger.exception(f"Upload status failed: {e}")
+        return 404, {"details": "Upload not found"}
+    return 200, {"job_id": str(job_id), "status": status, "details": error}
+
 
 @api.post("/message", response={200:ReturnMessage, 400:ReturnError})
+@rate_limit(cost=1)
 def create_message(request, payload: MessageIn):
     try:
-        author = CustomUser.objects.get(id=request.user.id)
-        message = Message(content=payload.content, author=author)
-        message.save()
-    except CustomUser.DoesNotExist:
-        return 400, {"details": "Message creation failed"}
+        # request.user is already loaded by the auth middleware and the
+        # content was validated by MessageIn
+        message = Message.objects.create_validated(payload.content, request.user)
+        feed_cache.invalidate()
+        publish_message_created(message.id)
     except ValidationError:
         return 400, {"details": "Message creation failed"}
     except Exception as e:
@@ -299,58 +343,142 @@ def create_message(request, payload: MessageIn):
         return 400, {"details": "Message creation failed"}
     return 200, {"message": "Message created successfully"}
 
+@api.post("/message/batch", response={200: BatchOut, 400: ReturnError})
+@rate_limit(cost=10)
+def create_message_batch(request):
+    # NDJSON body, one {"content": "..."} per line, all rows or none
+    try:
+        if int(request.META.get("CONTENT_LENGTH") or 0) > MAX_BATCH_BYTES:
+            return 400, {"details": "Batch too large"}
+        records = list(islice(read_records(request), MAX_BATCH_MESSAGES + 1))
+        if not records:
+            return 400, {"details": "Batch is empty"}
+        if len(records) > MAX_BATCH_MESSAGES:
+            return 400, {"details": "Batch too large"}
+        invalid = invalid_rows(records)
+        if invalid:
+            return 400, {"details": f"Invalid message on line {invalid[0]['line']}"}
+
+        created = 0
+        with transaction.atomic():
+            for chunk in chunked(records, CHUNK_SIZE):
+                created += insert_chunk(chunk, author=request.user)
+        feed_cache.invalidate()
+    except IngestError as e:
+        return 400, {"details": f"Invalid message on line {e.line}"}
+    except Exception as e:
+        logger.exception(f"Batch message creation failed: {e}")
+        return 400, {"details": "Message creation failed"}
+    return 200, {"created": created}
+
 @api.get("/message", response={200: List[MessageOut], 400: ReturnError})
-def list_message(request):
+def list_message(
+    request,
+    limit: int = Query(FEED_PAGE_SIZE, ge=1, le=FEED_MAX_PAGE_SIZE),
+    before: Optional[int] = Query(None, ge=1),
+    after: Optional[int] = Query(None, ge=0),
+    since: Optional[int] = Query(None, ge=0),
+):
     try:
-        messages = Message.objects.all()
-        message_list = []
-        for message in messages:
-            profile_picture_obj, created = Profile_Picture.objects.get_or_create(user=message.author)
-            message_list.append({
-                "id": message.id,
-                "uuid": str(message.uuid),
-                "content": message.content,
-                "author": message.author.username,
-                "profile_picture": profile_picture_obj.profile_picture if profile_picture_obj.profile_picture else "",
-            })
+        # since is an alias of after for incremental fetches
+        if after is None:
+            after = since
+        # Read before rendering: a write racing the render can only make the
+        # tag older than the body, never newer
+        version = feed_cache.version()
+        etag = f'"feed-{version}"'
+        # Cached as encoded JSON under the same version, a hit skips the
+        # query and serialization
+        return conditional_response(request, etag, lambda: feed_cache.get_or_load(
+            ("page", limit, before, after),
+            lambda: render_feed(limit=limit, before=before, after=after),
+            version=version,
+        ))
     except Exception as e:
         logger.exception(f"Message retrieval failed: {e}")
         return 400, {"details": "Message retrieval failed"}
-    return 200, message_list
+
+@api.get("/message/export", auth=django_auth_superuser, response={400: ReturnError})
+def export_messages(request, format: str = "ndjson"):
+    # Full history for admins and backups. Rows are fetched and written a
+    # chunk at a time, so memory stays flat whatever the table size. Needs
+    # the WSGI entry point, ASGI buffers synchronous streams.
+    if format not in EXPORT_FORMATS:
+        return 400, {"details": "Unknown format"}
+    content_type = "application/json" if format == "json" else "application/x-ndjson"
+    response = StreamingHttpResponse(encode_export(format=format), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="messages.{format}"'
+    return response
+
+@api.get("/message/search", response={200: List[MessageOut], 400: ReturnError})
+def search_message(
+    request,
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=SEARCH_MAX_OFFSET),
+):
+    # Best match first. Postgres full-text index, in-process index on SQLite
+    try:
+        if SEARCH_QUERY.match(q) is None:
+            return 400, {"details": "Invalid search"}
+        # Cached with the feed pages, so any write drops stale results
+        body = feed_cache.get_or_load(
+            ("search", " ".join(q.lower().split()), limit, offset),
+            lambda: encode_rows(search_messages(q, limit, offset)),
+        )
+    except Exception as e:
+        logger.exception(f"Message search failed: {e}")
+        return 400, {"details": "Message search failed"}
+    return HttpResponse(body, content_type="application/json")
+
+@api.get("/events", auth=async_django_auth, response={501: ReturnError})
+async def message_events(request):
+    # Server-Sent Events: message_created / message_deleted deltas.
+    # Served from the ASGI entry point only; under WSGI (the Vercel
+    # deployment) the client gets a 501 and falls back to fetch-after-write.
+    if not streaming_supported(request):
+        return 501, {"details": "Event stream not available"}
+    return event_stream_response()
 
 @api.delete("/message/{message_uuid}", response={200: ReturnMessage, 400: ReturnError})
+@rate_limit(cost=1)
 def delete_message(request, message_uuid: str):
     try:
-        message = Message.objects.get(uuid=message_uuid)
-        if request.user != message.author or request.user.username != message.author.username or request.user.id != message.author.id:
+        message_uuid = uuid.UUID(message_uuid)
+        # One DELETE, the author check is part of the WHERE clause
+        deleted, _ = Message.objects.filter(uuid=message_uuid, author_id=request.user.id).delete()
+        if not deleted:
             return 400, {"details": "Message deletion failed"}
-
-        message.delete()
-    except Message.DoesNotExist:
+        feed_cache.invalidate()
+        publish_message_deleted(message_uuid)
+    except ValueError:
         return 400, {"details": "Message deletion failed"}
     except Exception as e:
         logger.exception(f"Message deletion failed: {e}")
         return 400, {"details": "Message deletion failed"}
     return 200, {"message": "Message deleted successfully"}
 
-@api.get("/ai_slop", response={200: ReturnMessage, 400: ReturnError})
-def ai_slop(request):
+@api.get("/stats", auth=django_auth_superuser)
+def stats(request):
+    # Latency percentiles in ms for this process only
+    return {
+        "routes": registry.summary(),
+        "feed_cache": feed_cache.stats(),
+        "hashing": hashing_pool.stats(),
+        "rate_limit": limiter.stats(),
+    }
+
+@api.get("/ai_slop", response={200: ReturnMessage, 400: ReturnError}, auth=async_django_auth)
+@rate_limit(cost=5)
+async def ai_slop(request):
     try:
-        client = Groq(
-            api_key=GROQ_API_KEY,
-        )
-        chat_completion = client.chat.completions.create(
-            messages=[{
-                "role": "user",
-                "content": "Generate a 2 word Italian brain rot name like: 'bombardino crocodilo' or 'cappuccino assassino', respond with only 2 words.",
-            }],
-            model="llama3-8b-8192",
-        )
-
-        message = chat_completion.choices[0].message.content
-        cleaned_message = re.sub(r'[^a-zA-Z0-9 ]', '', message)
+        cleaned_message = slop_pool.take_nowait()
+        if cleaned_message is None:
+            # Buffer empty, ask Groq directly on a worker thread
+            cleaned_message = await sync_to_async(generate_name, thread_sensitive=False)()
         return 200, {"message": cleaned_message} 
     except Exception as e:
         logger.exception(f"Slop failed: {e}")
         return 400, {"details": "Slop failed"}
 
+
@@ -0,0 +1,18 @@
+"""
+ASGI config for netsec_website project.
+
+It exposes the ASGI callable as a module-level variable named ``app``.
+The /api/events stream needs this entry point; wsgi.py keeps serving
+everything else.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'netsec_website.settings')
+
+app = get_asgi_application()
@@ -0,0 +1,19 @@
+# ninja
+from ninja.security import SessionAuth
+
+
+class AsyncSessionAuth(SessionAuth):
+    # SessionAuth touches request.user synchronously, which raises inside
+    # async views; this resolves the user through request.auser() instead.
+    async def __call__(self, request):
+        key = self._get_key(request)
+        return await self.authenticate(request, key)
+
+    async def authenticate(self, request, key):
+        user = await request.auser()
+        if user.is_authenticated:
+            return user
+        return None
+
+
+async_django_auth = AsyncSessionAuth()
@@ -0,0 +1,24 @@
+# django
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+# python
+import hashlib
+
+
+def body_etag(body):
+    return f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+
+
+def conditional_response(request, etag, render):
+    # If-None-Match is answered from the tag alone, render() only runs when
+    # the client's copy is stale. Proxies that compress weaken the tag, so
+    # W/ is accepted too (RFC 9110 weak comparison).
+    held = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+    if "*" in held or etag in held or f"W/{etag}" in held:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(render(), content_type="application/json")
+    response["ETag"] = etag
+    # Per user behind the session cookie, and always revalidated
+    response["Cache-Control"] = "private, no-cache"
+    return response
@@ -0,0 +1,109 @@
+# django
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+#api
+from .feed import feed_queryset, serialize_row
+# python
+import asyncio
+import json
+import threading
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = 15
+RETRY_MILLISECONDS = 3000
+
+
+class BroadcastHub:
+    # Fan-out of feed events to every connected stream in this process.
+    # publish() is called from sync views running in worker threads, so
+    # delivery is handed to each subscriber's event loop thread-safely.
+    def __init__(self, max_queue=256):
+        self.max_queue = max_queue
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def publish(self, event, data):
+        with self._lock:
+            targets = list(self._subscribers.items())
+        for queue, loop in targets:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, (event, data))
+            except RuntimeError:
+                # Loop already closed, the stream is gone
+                self.unsubscribe(queue)
+
+    @staticmethod
+    def _deliver(queue, item):
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Slow client, it can resync with GET /message?after=
+            pass
+
+
+message_hub = BroadcastHub()
+
+
+def publish_message_created(message_id):
+    if not message_hub.has_subscribers():
+        return
+    row = feed_queryset().filter(id=message_id).first()
+    if row is not None:
+        message_hub.publish("message_created", serialize_row(row))
+
+
+def publish_message_deleted(message_uuid):
+    if not message_hub.has_subscribers():
+        return
+    message_hub.publish("message_deleted", {"uuid": str(message_uuid)})
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def event_stream():
+    # Subscribes on the first iteration, inside the try: a response dropped
+    # before Django starts iterating it never leaves a queue behind
+    queue = None
+    try:
+        queue = message_hub.subscribe()
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        while True:
+            try:
+                event, data = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event(event, data)
+    finally:
+        if queue is not None:
+            message_hub.unsubscribe(queue)
+
+
+def streaming_supported(request):
+    # Only the ASGI handler writes an async stream as it goes, WSGI would
+    # buffer it (and hold the worker) forever
+    return isinstance(request, ASGIRequest)
+
+
+def event_stream_response():
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,144 @@
+# django
+from django.db import connection
+#api
+from api.models import Message
+# python
+from itertools import islice
+import logging
+import re
+import orjson
+
+
+# Everything the feed needs, fetched in one SELECT with the author and
+# picture tables LEFT JOINed in. Profile_Picture is reached through the
+# reverse one-to-one, so users without a picture simply give NULL.
+FEED_COLUMNS = (
+    'id',
+    'uuid',
+    'content',
+    'author__username',
+    'author__profile_picture__profile_picture',
+    'created_at',
+)
+
+# MessageOut's per-row content validator, applied to a whole page at once:
+# contents are joined with newlines and matched in one scan.
+CONTENT_BATCH = re.compile(r'[a-zA-Z0-9 ]+(?:\n[a-zA-Z0-9 ]+)*')
+CONTENT_ROW = re.compile(r'[a-zA-Z0-9 ]+')
+
+# Keyset pagination on Message.id
+FEED_PAGE_SIZE = 50
+FEED_MAX_PAGE_SIZE = 200
+
+# Rows per fetch when streaming the whole table
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = ("ndjson", "json")
+
+logger = logging.getLogger(__name__)
+
+
+def feed_queryset():
+    # Read only: never creates Profile_Picture rows like get_or_create did
+    return Message.objects.values_list(*FEED_COLUMNS)
+
+
+def feed_page(limit=FEED_PAGE_SIZE, before=None, after=None):
+    # Rows always come back oldest first, whichever direction was scanned
+    queryset = feed_queryset()
+    if before is not None:
+        queryset = queryset.filter(id__lt=before)
+    if after is not None:
+        # Incremental fetch: the oldest messages newer than the client's last
+        return list(queryset.filter(id__gt=after).order_by('id')[:limit])
+    rows = list(queryset.order_by('-id')[:limit])
+    rows.reverse()
+    return rows
+
+
+def row_dict(row):
+    message_id, message_uuid, content, author, profile_picture, created_at = row
+    return {
+        "id": message_id,
+        "uuid": message_uuid,
+        "content": content,
+        "author": author,
+        "profile_picture": profile_picture if profile_picture else "",
+        "created_at": created_at,
+    }
+
+
+def serialize_row(row):
+    # Plain JSON types, for encoders other than orjson
+    data = row_dict(row)
+    data["uuid"] = str(data["uuid"])
+    data["created_at"] = data["created_at"].isoformat()
+    return data
+
+
+def valid_row(row):
+    # Exactly what MessageOut accepts for one row
+    return CONTENT_ROW.fullmatch(row[2]) is not None and row[3].isalnum()
+
+
+def validate_rows(rows):
+    # Rows were full_clean()ed on the way in, this only keeps the guarantee
+    # that nothing MessageOut would reject is ever sent. The whole page is
+    # checked in one scan; only when that fails is it walked row by row, and
+    # rows that fail are dropped so one bad row cannot take the page down.
+    if not rows:
+        return rows
+    contents = "\n".join(row[2] for row in rows)
+    authors = [row[3] for row in rows]
+    # The newline count catches a separator smuggled inside one content
+    if (
+        contents.count("\n") == len(rows) - 1
+        and CONTENT_BATCH.fullmatch(contents) is not None
+        and all(authors) and "".join(authors).isalnum()
+    ):
+        return rows
+    valid = [row for row in rows if valid_row(row)]
+    logger.warning(f"Dropped {len(rows) - len(valid)} feed rows that failed output validation")
+    return valid
+
+
+def encode_rows(rows):
+    # orjson writes UUIDs and datetimes itself, so rows go out without per-field str() or pydantic
+    return orjson.dumps([row_dict(row) for row in validate_rows(rows)])
+
+
+def render_feed(limit=FEED_PAGE_SIZE, before=None, after=None):
+    return encode_rows(feed_page(limit, before, after))
+
+
+def export_chunks(chunk_size=EXPORT_CHUNK_SIZE):
+    # Whole table, oldest first, never more than chunk_size rows in memory
+    queryset = feed_queryset().order_by('id')
+    if connection.settings_dict.get('DISABLE_SERVER_SIDE_CURSORS'):
+        # Behind a transaction pooler the driver would buffer the full result,
+        # so walk the primary key in keyset batches instead
+        after = 0
+        while rows := list(queryset.filter(id__gt=after)[:chunk_size]):
+            yield rows
+            after = rows[-1][0]
+        return
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        yield chunk
+
+
+def encode_export(chunk_size=EXPORT_CHUNK_SIZE, format="ndjson"):
+    # Bytes for a StreamingHttpResponse or a file, one write per chunk
+    if format == "json":
+        yield b"["
+    first = True
+    for rows in export_chunks(chunk_size):
+        lines = [orjson.dumps(row_dict(row)) for row in validate_rows(rows)]
+        if not lines:
+            continue
+        if format == "json":
+            yield (b"," if not first else b"") + b",".join(lines)
+        else:
+            yield b"\n".join(lines) + b"\n"
+        first = False
+    if format == "json":
+        yield b"]"
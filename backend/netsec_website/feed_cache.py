@@ -0,0 +1,122 @@
+# django
+from django.conf import settings
+from django.core.cache import caches
+# python
+from collections import OrderedDict
+import secrets
+import threading
+import time
+
+
+class LRUFeedCache:
+    # Process-local, so another instance's writes never reach it. Instead
+    # the version rolls over every max_age seconds, which bounds how long a
+    # page (and its ETag) can outlive a write made elsewhere; use the shared
+    # backend when that matters.
+    def __init__(self, max_entries=256, max_age=10):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # The process token keeps two workers' versions from ever matching
+        self._token = secrets.token_hex(4)
+        self._version = 1
+
+    def version(self):
+        epoch = int(time.monotonic() // self.max_age)
+        return f"{self._token}.{self._version}.{epoch}"
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, version):
+        with self._lock:
+            # Loaded before an invalidate() or a rollover, never store it
+            if version != self.version():
+                return
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version += 1
+
+
+class SharedFeedCache:
+    # Any Django cache alias (Redis, Memcached, or LocMemCache as a local
+    # stand-in). Pages are keyed under a random generation token that is
+    # replaced on invalidation, so clearing never has to enumerate keys and
+    # a lost generation key never brings back an old token.
+    GENERATION_KEY = "feed:generation"
+
+    def __init__(self, alias="default", timeout=300):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def version(self):
+        generation = self.cache.get(self.GENERATION_KEY)
+        if generation is None:
+            self.cache.add(self.GENERATION_KEY, secrets.token_hex(8), timeout=None)
+            generation = self.cache.get(self.GENERATION_KEY)
+        return generation
+
+    def _key(self, key, version):
+        return f"feed:{version}:" + ":".join(str(part) for part in key)
+
+    def get(self, key, version):
+        return self.cache.get(self._key(key, version))
+
+    def set(self, key, value, version):
+        # Stored under the generation read before loading: a page loaded
+        # across an invalidate() lands in the old generation nobody reads
+        self.cache.set(self._key(key, version), value, timeout=self.timeout)
+
+    def clear(self):
+        self.cache.set(self.GENERATION_KEY, secrets.token_hex(8), timeout=None)
+
+
+class FeedCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key, loader, version=None):
+        # version must be read before anything the page is built from
+        if version is None:
+            version = self.backend.version()
+        value = self.backend.get(key, version)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = loader()
+        self.backend.set(key, value, version)
+        return value
+
+    def invalidate(self):
+        self.backend.clear()
+
+    def version(self):
+        # Changes on every invalidate(), the feed's ETag
+        return self.backend.version()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def build_backend(config):
+    if config.get("BACKEND") == "shared":
+        return SharedFeedCache(config.get("ALIAS", "default"), config.get("TIMEOUT", 300))
+    return LRUFeedCache(config.get("MAX_ENTRIES", 256), config.get("MAX_AGE", 10))
+
+
+feed_cache = FeedCache(build_backend(getattr(settings, "FEED_CACHE", {})))
@@ -0,0 +1,47 @@
+# python
+from io import BytesIO
+#api
+from .sniff import sniff_mime, ALLOWED_MIME_TYPES
+# Pillow
+from PIL import Image, UnidentifiedImageError
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+ALLOWED_FORMATS = ('JPEG', 'PNG')
+PICTURE_SIZE = (64, 64)
+# A 5 KB file can still declare huge dimensions, refuse before decoding
+MAX_IMAGE_PIXELS = 4096 * 4096
+
+
+def sanitize_image(file_data):
+    # Decodes once and returns a fresh 64x64 RGB PNG built only from pixel
+    # data, or None if the bytes are not a valid JPEG/PNG.
+    try:
+        raw_img = Image.open(BytesIO(file_data), formats=ALLOWED_FORMATS)
+        if raw_img.width * raw_img.height > MAX_IMAGE_PIXELS:
+            return None
+        # JPEG only: libjpeg downscales by up to 1/8 while decoding
+        raw_img.draft("RGB", PICTURE_SIZE)
+        # The single decode, raises on truncated or corrupt data like verify() did
+        raw_img.load()
+        img = raw_img.convert("RGB")
+        img = img.resize(PICTURE_SIZE, reducing_gap=3.0)
+    except UnidentifiedImageError:
+        return None
+    except Exception as e:
+        logger.exception(f"Image decode failed: {e}")
+        return None
+
+    # Rebuilt from raw pixels so no EXIF, ICC profile or text chunk survives
+    clean_img = Image.frombytes("RGB", PICTURE_SIZE, img.tobytes())
+    safe_buffer = BytesIO()
+    clean_img.save(safe_buffer, format="PNG")
+    return safe_buffer.getvalue()
+
+
+def sanitize_picture(file_data):
+    # Returns the re-encoded 64x64 PNG, or None if the upload is not a real image
+    if sniff_mime(file_data) not in ALLOWED_MIME_TYPES:
+        return None
+    return sanitize_image(file_data)
@@ -0,0 +1,81 @@
+# django
+from django.db import transaction
+#api
+from api.models import Message, CustomUser
+from .feed import CONTENT_BATCH
+# python
+from itertools import islice
+import re
+import orjson
+
+# MessageIn allows alphanumerics and spaces, the model caps the length
+CONTENT = re.compile(r'[a-zA-Z0-9 ]+')
+MAX_CONTENT_LENGTH = Message._meta.get_field('content').max_length
+CHUNK_SIZE = 500
+
+
+class IngestError(ValueError):
+    def __init__(self, line, reason):
+        super().__init__(f"line {line}: {reason}")
+        self.line = line
+
+
+def read_records(lines):
+    # NDJSON, one {"content": ..., "author": optional username} per line
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            raise IngestError(number, "not valid JSON")
+        if not isinstance(record, dict) or not isinstance(record.get("content"), str):
+            raise IngestError(number, "content must be a string")
+        record["line"] = number
+        yield record
+
+
+def chunked(records, size):
+    records = iter(records)
+    while chunk := list(islice(records, size)):
+        yield chunk
+
+
+def invalid_rows(records):
+    # Same rules as MessageIn plus the model's length validators. A clean
+    # chunk is one regex scan over the joined contents; rows are only
+    # checked one by one to point at the failures.
+    contents = [record["content"] for record in records]
+    joined = "\n".join(contents)
+    if (
+        joined.count("\n") == len(contents) - 1
+        and CONTENT_BATCH.fullmatch(joined) is not None
+        and max(map(len, contents)) <= MAX_CONTENT_LENGTH
+    ):
+        return []
+    return [
+        record for record in records
+        if CONTENT.fullmatch(record["content"]) is None or len(record["content"]) > MAX_CONTENT_LENGTH
+    ]
+
+
+def resolve_authors(records):
+    usernames = {record["author"] for record in records if isinstance(record.get("author"), str)}
+    authors = dict(CustomUser.objects.filter(username__in=usernames).values_list("username", "id"))
+    for record in records:
+        if authors.get(record.get("author")) is None:
+            raise IngestError(record["line"], "unknown author")
+    return authors
+
+
+def insert_chunk(records, author=None):
+    # Rows must already have passed invalid_rows(); author overrides any
+    # per-line author, which is how the API pins rows to the session user.
+    if author is not None:
+        messages = [Message(content=record["content"], author=author) for record in records]
+    else:
+        authors = resolve_authors(records)
+        messages = [Message(content=record["content"], author_id=authors[record["author"]]) for record in records]
+    with transaction.atomic():
+        Message.objects.bulk_create(messages)
+    return len(messages)
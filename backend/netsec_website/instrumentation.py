@@ -0,0 +1,173 @@
+# django
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.decorators import sync_and_async_middleware
+# python
+from asgiref.sync import iscoroutinefunction
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
+import threading
+import time
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+# Recent samples kept per route for the percentiles
+HISTOGRAM_SIZE = 1024
+
+
+class Histogram:
+    def __init__(self, size=HISTOGRAM_SIZE):
+        self.count = 0
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, value):
+        with self._lock:
+            self._samples.append(value)
+            self.count += 1
+
+    def summary(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self.count
+        if not samples:
+            return {"count": count}
+        def pick(q):
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))], 3)
+        return {"count": count, "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+class Registry:
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, value):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram())
+        histogram.record(value)
+
+    def summary(self):
+        return {name: histogram.summary() for name, histogram in sorted(self._histograms.items())}
+
+
+class RequestMetrics:
+    __slots__ = ("db_queries", "db_seconds", "outbound")
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.outbound = {}
+
+
+# Milliseconds, keyed "METHOD route", "db METHOD route" and "outbound name"
+registry = Registry()
+_current = ContextVar("request_metrics", default=None)
+
+
+def db_wrapper(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_seconds += time.perf_counter() - start
+        metrics.db_queries += 1
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    # Every connection, including the ones sync_to_async threads open; the
+    # contextvar decides which request a query is charged to.
+    if db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_wrapper)
+
+
+connection_created.connect(install_db_wrapper)
+for existing in connections.all(initialized_only=True):
+    install_db_wrapper(None, existing)
+
+
+@contextmanager
+def track_outbound(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.record(f"outbound {name}", elapsed * 1000)
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.outbound[name] = metrics.outbound.get(name, 0.0) + elapsed
+
+
+def route_name(request):
+    match = getattr(request, "resolver_match", None)
+    route = match.route if match is not None else "unmatched"
+    return f"{request.method} {route}"
+
+
+def wants_server_timing(request):
+    if settings.SERVER_TIMING == "all":
+        return True
+    if settings.SERVER_TIMING == "staff":
+        # request.auth is the user ninja's auth resolved; the lazy
+        # request.user could hit the database from async code
+        return getattr(getattr(request, "auth", None), "is_staff", False)
+    return False
+
+
+def finish(request, response, metrics, start):
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    db_ms = metrics.db_seconds * 1000
+    route = route_name(request)
+    registry.record(route, elapsed_ms)
+    registry.record(f"db {route}", db_ms)
+
+    if wants_server_timing(request):
+        timings = [f"app;dur={elapsed_ms:.1f}", f'db;dur={db_ms:.1f};desc="{metrics.db_queries} queries"']
+        timings += [f"{name};dur={seconds * 1000:.1f}" for name, seconds in metrics.outbound.items()]
+        response["Server-Timing"] = ", ".join(timings)
+
+    if settings.INSTRUMENTATION_LOG:
+        logger.info(json.dumps({
+            "route": route,
+            "status": response.status_code,
+            "ms": round(elapsed_ms, 2),
+            "db_queries": metrics.db_queries,
+            "db_ms": round(db_ms, 2),
+            "outbound_ms": {name: round(seconds * 1000, 2) for name, seconds in metrics.outbound.items()},
+        }))
+    return response
+
+
+@sync_and_async_middleware
+def instrumentation_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            metrics = RequestMetrics()
+            token = _current.set(metrics)
+            start = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            return finish(request, response, metrics, start)
+    else:
+        def middleware(request):
+            metrics = RequestMetrics()
+            token = _current.set(metrics)
+            start = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+            return finish(request, response, metrics, start)
+    return middleware
@@ -0,0 +1,157 @@
+# ninja
+from ninja.throttling import BaseThrottle
+# django
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+# python
+from asgiref.sync import iscoroutinefunction
+from collections import OrderedDict
+from functools import wraps
+import math
+import threading
+import time
+
+
+def refill(state, now, rate, burst):
+    tokens, stamp = state or (burst, now)
+    return min(burst, tokens + (now - stamp) * rate)
+
+
+def settle(levels, cost, limits):
+    # Seconds each bucket is short of cost, all 0.0 when every bucket can
+    # pay; only then are they debited. A cost above a bucket's burst could
+    # never be paid and is clamped to it.
+    costs = [min(cost, burst) for _, _, burst in limits]
+    waits = [
+        max(0.0, (spend - tokens) / rate)
+        for tokens, spend, (_, rate, _) in zip(levels, costs, limits)
+    ]
+    if not any(waits):
+        levels = [tokens - spend for tokens, spend in zip(levels, costs)]
+    return levels, waits
+
+
+class MemoryBuckets:
+    # (tokens, last refill) per key, least recently used keys are dropped
+    # past max_keys. A dropped bucket comes back full, which only ever
+    # errs towards letting a long-idle client through.
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, limits, cost):
+        # limits is [(key, rate, burst)], returns the wait for each
+        now = time.monotonic()
+        with self._lock:
+            levels = [refill(self._buckets.pop(key, None), now, rate, burst) for key, rate, burst in limits]
+            levels, waits = settle(levels, cost, limits)
+            for (key, _, _), tokens in zip(limits, levels):
+                self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return waits
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SharedBuckets:
+    # Any Django cache alias, LocMemCache works as a local stand-in. The
+    # read-modify-write is not atomic, so concurrent requests for one key
+    # can both pass; good enough for abuse limits across instances.
+    def __init__(self, alias="default"):
+        self.cache = caches[alias]
+
+    def take(self, limits, cost):
+        now = time.time()
+        cache_keys = [f"bucket:{key}" for key, _, _ in limits]
+        states = self.cache.get_many(cache_keys)
+        levels = [
+            refill(states.get(cache_key), now, rate, burst)
+            for cache_key, (_, rate, burst) in zip(cache_keys, limits)
+        ]
+        levels, waits = settle(levels, cost, limits)
+        # Past the time to refill completely the entry is the default anyway
+        for cache_key, tokens, (_, rate, burst) in zip(cache_keys, levels, limits):
+            self.cache.set(cache_key, (tokens, now), timeout=math.ceil(burst / rate) + 1)
+        return waits
+
+    def __len__(self):
+        return 0
+
+
+class RateLimiter:
+    # Every limited request spends its route's cost from three buckets: the
+    # user's (when authenticated), the client IP's, and one for the whole
+    # instance. The first two answer 429, the instance bucket sheds load
+    # with 503 once the process is taking more than it can serve. Buckets
+    # are debited together, only when all of them can pay.
+    def __init__(self, buckets, config):
+        self.buckets = buckets
+        self.config = config
+        self.limited = 0
+        self.shed = 0
+        self._ident = BaseThrottle()
+
+    def check(self, request, cost):
+        config = self.config
+        limits = [("global", config["GLOBAL_RATE"], config["GLOBAL_BURST"])]
+        ip = self._ident.get_ident(request)
+        limits.append((f"ip:{ip}", config["IP_RATE"], config["IP_BURST"]))
+        # request.auth is the user ninja's auth resolved, sync or async,
+        # so the lazy request.user is never touched here
+        user = getattr(request, "auth", None)
+        if getattr(user, "pk", None) is not None:
+            limits.append((f"user:{user.pk}", config["USER_RATE"], config["USER_BURST"]))
+        waits = self.buckets.take(limits, cost)
+        wait = max(waits[1:])
+        if wait:
+            self.limited += 1
+            return limited_response(429, "Too many requests", wait)
+        if waits[0]:
+            self.shed += 1
+            return limited_response(503, "Server busy", waits[0])
+        return None
+
+    def stats(self):
+        return {"limited": self.limited, "shed": self.shed, "buckets": len(self.buckets)}
+
+
+def limited_response(status, details, wait):
+    response = HttpResponse(f'{{"details": "{details}"}}', content_type="application/json", status=status)
+    response["Retry-After"] = str(math.ceil(wait))
+    return response
+
+
+def build_buckets(config):
+    if config.get("BACKEND") == "shared":
+        return SharedBuckets(config.get("ALIAS", "default"))
+    return MemoryBuckets(config.get("MAX_KEYS", 10000))
+
+
+limiter = RateLimiter(build_buckets(settings.RATE_LIMIT), settings.RATE_LIMIT)
+
+
+def rate_limit(cost=1):
+    # Goes under the @api route decorator so it runs after authentication:
+    #   @api.post("/upload", ...)
+    #   @rate_limit(cost=5)
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                denied = limiter.check(request, cost)
+                if denied is not None:
+                    return denied
+                return await view(request, *args, **kwargs)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                denied = limiter.check(request, cost)
+                if denied is not None:
+                    return denied
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,11 @@
+# ninja
+from ninja.renderers import BaseRenderer
+# python
+import orjson
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = "application/json"
+
+    def render(self, request, data, *, response_status):
+        return orjson.dumps(data)
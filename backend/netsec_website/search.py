@@ -0,0 +1,177 @@
+# django
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Count, F, Max
+#api
+from api.models import Message
+from .feed import feed_queryset, FEED_COLUMNS
+from .feed_cache import feed_cache
+# python
+from collections import Counter
+import heapq
+import math
+import re
+import threading
+import time
+
+SEARCH_CONFIG = 'english'
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+# Ranked results cannot be keyset paginated, deep offsets are capped instead
+SEARCH_MAX_OFFSET = 1000
+
+TOKEN = re.compile(r'[a-z0-9]+')
+# websearch syntax the fallback understands: words, "quoted phrases" (an
+# unclosed quote runs to the end) and a leading - to exclude either
+QUERY_PART = re.compile(r'(-?)"([^"]*)"?|(-?)([^\s"]+)')
+# The fallback ranks at most this many matches, newest first
+SEARCH_MAX_CANDIDATES = 5000
+# Seconds the fallback index trusts itself without a write from this process
+INDEX_RECHECK_AFTER = 5
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+def parse_query(q):
+    # (required terms, required phrases, excluded terms, excluded phrases),
+    # phrases as token tuples. A word that tokenizes to several terms, like
+    # foo-bar, is a phrase, as in websearch.
+    terms, phrases, excluded_terms, excluded_phrases = set(), [], set(), []
+    for match in QUERY_PART.finditer(q):
+        negate = bool(match.group(1) or match.group(3))
+        tokens = tuple(tokenize(match.group(2) if match.group(2) is not None else match.group(4)))
+        if not tokens:
+            continue
+        if negate:
+            if len(tokens) == 1:
+                excluded_terms.add(tokens[0])
+            else:
+                excluded_phrases.append(tokens)
+        else:
+            terms.update(tokens)
+            if len(tokens) > 1:
+                phrases.append(tokens)
+    return terms, phrases, excluded_terms, excluded_phrases
+
+
+def contains_phrase(tokens, phrase):
+    size = len(phrase)
+    return any(tokens[i:i + size] == phrase for i in range(len(tokens) - size + 1))
+
+
+def postgres_search(q, limit, offset):
+    # websearch syntax: words are ANDed, "quoted phrases" and -exclusions work
+    query = SearchQuery(q, config=SEARCH_CONFIG, search_type='websearch')
+    return list(
+        Message.objects
+        .filter(search_vector=query)
+        .annotate(rank=SearchRank(F('search_vector'), query))
+        .order_by('-rank', '-id')
+        .values_list(*FEED_COLUMNS)[offset:offset + limit]
+    )
+
+
+class InvertedIndex:
+    # Fallback for SQLite test runs, which have no full-text type Django can
+    # use. Words, phrases and -exclusions behave like the websearch query,
+    # but there is no stemming or stop word list (and no "or"), so results
+    # differ from Postgres at the edges. Scores are tf-idf over message
+    # length, computed for the newest SEARCH_MAX_CANDIDATES matches so common
+    # words stay cheap.
+    def __init__(self):
+        self.postings = {}   # term -> {message id: term frequency}
+        self.documents = {}  # message id -> tokens, for phrases and removal
+        self.max_id = 0
+        self.version = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, message_id, content):
+        tokens = tuple(tokenize(content))
+        self.documents[message_id] = tokens
+        for term, frequency in Counter(tokens).items():
+            self.postings.setdefault(term, {})[message_id] = frequency
+        self.max_id = max(self.max_id, message_id)
+
+    def remove(self, message_id):
+        for term in set(self.documents.pop(message_id, ())):
+            posting = self.postings[term]
+            del posting[message_id]
+            if not posting:
+                del self.postings[term]
+
+    def load(self, queryset):
+        for message_id, content in queryset.order_by('id').values_list('id', 'content').iterator(chunk_size=2000):
+            self.add(message_id, content)
+
+    def refresh(self):
+        # Checked when this process wrote (the feed version moved) or every
+        # INDEX_RECHECK_AFTER seconds for writes made elsewhere. Ids only
+        # grow, so new messages are the ones past max_id; a count that still
+        # disagrees means deletes, found by diffing ids alone. Messages are
+        # never edited.
+        version = feed_cache.version()
+        now = time.monotonic()
+        if version == self.version and now - self.checked_at < INDEX_RECHECK_AFTER:
+            return
+        self.version, self.checked_at = version, now
+        latest = Message.objects.aggregate(max_id=Max('id'), count=Count('id'))
+        if (latest['max_id'] or 0) > self.max_id:
+            self.load(Message.objects.filter(id__gt=self.max_id))
+        if latest['count'] != len(self.documents):
+            existing = set(Message.objects.values_list('id', flat=True).iterator(chunk_size=2000))
+            for message_id in [i for i in self.documents if i not in existing]:
+                self.remove(message_id)
+
+    def matches(self, message_id, phrases, excluded_terms, excluded_phrases):
+        tokens = self.documents[message_id]
+        if excluded_terms and not excluded_terms.isdisjoint(tokens):
+            return False
+        if any(contains_phrase(tokens, phrase) for phrase in excluded_phrases):
+            return False
+        return all(contains_phrase(tokens, phrase) for phrase in phrases)
+
+    def search(self, q, limit, offset):
+        terms, phrases, excluded_terms, excluded_phrases = parse_query(q)
+        if not (terms or excluded_terms or excluded_phrases):
+            return []
+        with self._lock:
+            self.refresh()
+            postings = [self.postings.get(term) for term in terms]
+            if not all(postings):
+                return []
+            total = len(self.documents)
+            weighted = [(posting, math.log(1 + total / len(posting))) for posting in postings]
+            weighted.sort(key=lambda pair: len(pair[0]))
+            # Postings and documents are filled in id order, so walking the
+            # rarest posting backwards visits matches newest first. A query
+            # of exclusions only walks every message.
+            walk = weighted[0][0] if weighted else self.documents
+            rest = [posting for posting, _ in weighted[1:]]
+            candidates = []
+            for message_id in reversed(walk):
+                if all(message_id in posting for posting in rest) and self.matches(
+                    message_id, phrases, excluded_terms, excluded_phrases
+                ):
+                    candidates.append(message_id)
+                    if len(candidates) == SEARCH_MAX_CANDIDATES:
+                        break
+            scored = heapq.nlargest(offset + limit, (
+                (sum(posting[i] * weight for posting, weight in weighted) / max(len(self.documents[i]), 1), i)
+                for i in candidates
+            ))
+        page = [message_id for _, message_id in scored[offset:]]
+        rows = {row[0]: row for row in feed_queryset().filter(id__in=page)}
+        return [rows[message_id] for message_id in page if message_id in rows]
+
+
+inverted_index = InvertedIndex()
+
+
+def search_messages(q, limit=SEARCH_PAGE_SIZE, offset=0):
+    # Feed rows, best match first
+    if connection.vendor == 'postgresql':
+        return postgres_search(q, limit, offset)
+    return inverted_index.search(q, limit, offset)
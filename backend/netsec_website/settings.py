@@ -22,8 +22,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECRET_KEY = env('SECRET_KEY')
 # SECRET_KEY_FALLBACK = env('SECRET_KEY_FALLBACK')
 SECRET_KEY = os.environ["SECRET_KEY"]
+# Optional, only set while a rotated key's sessions are still around
 SECRET_KEY_FALLBACKS = [
-    os.environ["SECRET_KEY_FALLBACK"],
+    key for key in [os.environ.get("SECRET_KEY_FALLBACK")] if key
 ]
 
 
@@ -52,6 +53,7 @@ INSTALLED_APPS = [
 ] 
 
 MIDDLEWARE = [
+    'netsec_website.instrumentation.instrumentation_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     # 'corsheaders.middleware.CorsMiddleware', # REMOVE
@@ -81,6 +83,7 @@ TEMPLATES = [
 
 # WSGI_APPLICATION = 'netsec_website.wsgi.application'
 WSGI_APPLICATION = 'netsec_website.wsgi.app'
+ASGI_APPLICATION = 'netsec_website.asgi.app'
 
 
 # Database
@@ -93,13 +96,106 @@ WSGI_APPLICATION = 'netsec_website.wsgi.app'
 #     }
 # }
 
+# DB_POOL_MODE picks how lambdas share Postgres connections:
+#   persistent - one long-lived connection per instance (CONN_MAX_AGE)
+#   pool       - psycopg 3 pool per instance, capped by DB_POOL_MAX_SIZE
+#   pgbouncer  - DATABASE_URL points at a transaction pooler (pgbouncer or
+#                Neon's -pooler host), Postgres only sees the pooler's slots
+DB_POOL_MODE = os.environ.get("DB_POOL_MODE", "persistent")
+
 DATABASES = {
     'default': dj_database_url.config(
         default=os.environ.get("DATABASE_URL"),
-        conn_max_age=600
+        conn_max_age=0 if DB_POOL_MODE == "pool" else int(os.environ.get("DB_CONN_MAX_AGE", 600)),
+        conn_health_checks=True,
     )
 }
 
+if DATABASES['default'].get('ENGINE') == 'django.db.backends.postgresql':
+    DATABASES['default'].setdefault('OPTIONS', {})
+    # Fail over quickly instead of hanging a lambda on an unreachable host
+    DATABASES['default']['OPTIONS']['connect_timeout'] = int(os.environ.get("DB_CONNECT_TIMEOUT", 5))
+    if DB_POOL_MODE == "pool":
+        DATABASES['default']['OPTIONS']['pool'] = {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 0)),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 4)),
+            # Seconds to wait for a free connection before erroring
+            "timeout": float(os.environ.get("DB_POOL_TIMEOUT", 5)),
+            # Give idle connections back so frozen lambdas do not hold slots
+            "max_idle": float(os.environ.get("DB_POOL_MAX_IDLE", 60)),
+        }
+    elif DB_POOL_MODE == "pgbouncer":
+        # Transaction pooling cannot keep a server-side cursor between statements
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+
+# Feed cache
+# "lru" keeps feed pages in process memory, "shared" uses the CACHES alias
+FEED_CACHE = {
+    "BACKEND": os.environ.get("FEED_CACHE_BACKEND", "lru"),
+    "ALIAS": "default",
+    "MAX_ENTRIES": 256,
+    # lru: seconds a page may miss writes made by other instances
+    "MAX_AGE": int(os.environ.get("FEED_CACHE_MAX_AGE", 10)),
+    "TIMEOUT": 300,
+}
+
+# Rate limits
+# Token buckets refilled at RATE tokens per second up to BURST, routes spend
+# the cost given to @rate_limit. "shared" keeps buckets in the CACHES alias
+# so every instance sees the same counts.
+RATE_LIMIT = {
+    "BACKEND": os.environ.get("RATE_LIMIT_BACKEND", "memory"),
+    "ALIAS": "default",
+    "MAX_KEYS": 10000,
+    "USER_RATE": float(os.environ.get("RATE_LIMIT_USER_RATE", 2)),
+    "USER_BURST": float(os.environ.get("RATE_LIMIT_USER_BURST", 20)),
+    "IP_RATE": float(os.environ.get("RATE_LIMIT_IP_RATE", 5)),
+    "IP_BURST": float(os.environ.get("RATE_LIMIT_IP_BURST", 50)),
+    # Whole instance, past this requests are shed with 503
+    "GLOBAL_RATE": float(os.environ.get("RATE_LIMIT_GLOBAL_RATE", 100)),
+    "GLOBAL_BURST": float(os.environ.get("RATE_LIMIT_GLOBAL_BURST", 200)),
+}
+# Proxies in front of Django that append to X-Forwarded-For, the client IP
+# is the entry the outermost one added. Vercel's edge (VERCEL=1) is one hop;
+# with none, REMOTE_ADDR is used and a client-sent X-Forwarded-For ignored.
+NINJA_NUM_PROXIES = int(os.environ.get("NUM_PROXIES", 1 if os.environ.get("VERCEL") else 0))
+
+# Cache
+# Process-local unless REDIS_URL points at a shared Redis (needs redis-py)
+SHARED_CACHE = bool(os.environ.get("REDIS_URL"))
+if SHARED_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ["REDIS_URL"],
+        }
+    }
+
+
+# Sessions
+# cached_db reads sessions from the cache and only falls back to
+# django_session on a miss; signed_cookies needs no server storage at all.
+# Expired DB rows are removed with `manage.py clearsessions`. cached_db is
+# only the default with a shared cache: a process-local one would keep
+# accepting a session another instance logged out or deleted.
+SESSION_ENGINE = {
+    "db": "django.contrib.sessions.backends.db",
+    "cache": "django.contrib.sessions.backends.cache",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+}[os.environ.get("SESSION_BACKEND", "cached_db" if SHARED_CACHE else "db")]
+
+AUTHENTICATION_BACKENDS = [
+    'api.backends.CachedModelBackend',
+    # Sessions created before the cached backend still name this one. Only
+    # its get_user() runs, CachedModelBackend ends every password login
+    'django.contrib.auth.backends.ModelBackend',
+]
+# Seconds a CustomUser stays cached for request.user, 0 turns the cache off.
+# Off by default without a shared cache, invalidate_user() only reaches the
+# process it runs in.
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 60 if SHARED_CACHE else 0))
 
 
 # Password validation
@@ -120,13 +216,27 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# The first entry hashes new passwords. "argon2" (needs argon2-cffi) moves
+# the tuned Argon2 hasher to the front, existing PBKDF2 hashes are upgraded
+# on each user's next login.
+PASSWORD_HASHER = os.environ.get("PASSWORD_HASHER", "pbkdf2")
 PASSWORD_HASHERS = [
-    "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "api.hashers.PooledPBKDF2PasswordHasher",
     "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
-    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "api.hashers.PooledArgon2PasswordHasher",
     "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
     "django.contrib.auth.hashers.ScryptPasswordHasher",
 ]
+if PASSWORD_HASHER == "argon2":
+    PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(2))
+ARGON2_TIME_COST = int(os.environ.get("ARGON2_TIME_COST", 2))
+ARGON2_MEMORY_COST = int(os.environ.get("ARGON2_MEMORY_COST", 19456))  # KiB, OWASP minimum
+ARGON2_PARALLELISM = int(os.environ.get("ARGON2_PARALLELISM", 1))
+
+# Hashing runs on HASH_WORKERS threads with HASH_QUEUE_DEPTH callers allowed
+# to wait; login and sign-up beyond that get a 503 straight away
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", 1))
+HASH_QUEUE_DEPTH = int(os.environ.get("HASH_QUEUE_DEPTH", 4))
 
 
 # Internationalization
@@ -151,6 +261,17 @@ USE_TZ = True
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Per-request timing log lines, histograms are kept either way
+INSTRUMENTATION_LOG = os.environ.get('INSTRUMENTATION_LOG', '1') == '1'
+# Server-Timing response header: "off", "staff" or "all". It exposes
+# backend timings, so it is opt-in
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'off')
+
+# Cold start, see `manage.py check_import_budget`
+IMPORT_BUDGET_MS = int(os.environ.get('IMPORT_BUDGET_MS', 1000))
+# Heavy modules only /upload and /ai_slop need, must not load at startup
+LAZY_IMPORTS = ['groq', 'PIL', 'magic', 'vercel_blob']
+
 # Logging
 LOGGING = {
     "version": 1,
@@ -213,8 +334,12 @@ LOGGING = {
 # CORS_ALLOW_CREDENTIALS = True
 
 # Vercel blob
-VERCEL_BLOB_BASE_URL = os.environ['VERCEL_BLOB_BASE_URL']
-BLOB_READ_WRITE_TOKEN = os.environ['BLOB_READ_WRITE_TOKEN']
+# Optional at startup, only uploads need them (vercel_blob reads the token from the env)
+VERCEL_BLOB_BASE_URL = os.environ.get('VERCEL_BLOB_BASE_URL')
+BLOB_READ_WRITE_TOKEN = os.environ.get('BLOB_READ_WRITE_TOKEN')
+
+# Profile picture upload workers
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', os.cpu_count() or 2))
 
 
 AUTH_USER_MODEL = 'api.CustomUser'
@@ -222,11 +347,21 @@ AUTH_USER_MODEL = 'api.CustomUser'
 # SSL
 SECURE_SSL_REDIRECT = True
 CSRF_COOKIE_SECURE = True
+# The frontend reads csrftoken from the cookie instead of calling /api/csrf
+# before every write, so it has to stay visible to JavaScript
+CSRF_COOKIE_HTTPONLY = False
 SESSION_COOKIE_SECURE = True
 SECURE_HSTS_SECONDS = 3600
 SECURE_HSTS_INCLUDE_SUBDOMAINS = True
 SECURE_HSTS_PRELOAD = True
 
 #GROQ
-# GROQ_API_URL = os.environ['GROQ_API_URL']
-GROQ_API_KEY = os.environ['GROQ_API_KEY']
\ No newline at end of file
+GROQ_API_URL = os.environ.get('GROQ_API_URL')  # None uses the Groq default
+GROQ_API_KEY = os.environ.get('GROQ_API_KEY')  # checked by Groq on first /ai_slop
+GROQ_TIMEOUT = float(os.environ.get('GROQ_TIMEOUT', 10))
+GROQ_CONNECT_TIMEOUT = float(os.environ.get('GROQ_CONNECT_TIMEOUT', 3))
+GROQ_MAX_RETRIES = 1
+GROQ_MAX_CONNECTIONS = 10
+# Pre-generated /ai_slop names, refilled in the background at SLOP_REFILL_AT
+SLOP_BUFFER_SIZE = int(os.environ.get('SLOP_BUFFER_SIZE', 16))
+SLOP_REFILL_AT = int(os.environ.get('SLOP_REFILL_AT', 4))
\ No newline at end of file
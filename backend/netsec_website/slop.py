@@ -0,0 +1,109 @@
+# django
+from django.conf import settings
+#api
+from .instrumentation import track_outbound
+# python
+from collections import deque
+import re
+import threading
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+PROMPT = "Generate a 2 word Italian brain rot name like: 'bombardino crocodilo' or 'cappuccino assassino', respond with only 2 words."
+MODEL = "llama3-8b-8192"
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    # One client per process so the keep-alive pool and TLS session are
+    # reused. The sync client is used on purpose: an AsyncGroq pool is tied
+    # to one event loop, and under WSGI every request gets a fresh loop.
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # Imported here, groq and httpx are most of a cold start's import time
+                import httpx
+                from groq import Groq
+                timeout = httpx.Timeout(settings.GROQ_TIMEOUT, connect=settings.GROQ_CONNECT_TIMEOUT)
+                _client = Groq(
+                    api_key=settings.GROQ_API_KEY,
+                    base_url=settings.GROQ_API_URL,
+                    timeout=timeout,
+                    max_retries=settings.GROQ_MAX_RETRIES,
+                    http_client=httpx.Client(
+                        timeout=timeout,
+                        limits=httpx.Limits(
+                            max_connections=settings.GROQ_MAX_CONNECTIONS,
+                            max_keepalive_connections=settings.GROQ_MAX_CONNECTIONS,
+                        ),
+                    ),
+                )
+    return _client
+
+
+def generate_name():
+    client = get_client()
+    with track_outbound("groq"):
+        chat_completion = client.chat.completions.create(
+            messages=[{
+                "role": "user",
+                "content": PROMPT,
+            }],
+            model=MODEL,
+        )
+    message = chat_completion.choices[0].message.content
+    return re.sub(r'[^a-zA-Z0-9 ]', '', message)
+
+
+class NamePool:
+    # Buffer of already sanitized names, topped up by a background thread
+    # whenever it drops to refill_at.
+    def __init__(self, generate, size, refill_at):
+        self.generate = generate
+        self.size = size
+        self.refill_at = refill_at
+        self._names = deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+
+    def __len__(self):
+        return len(self._names)
+
+    def take_nowait(self):
+        # Never blocks on the upstream, None means the caller must generate
+        try:
+            name = self._names.popleft()
+        except IndexError:
+            name = None
+        if len(self._names) <= self.refill_at:
+            self.refill()
+        return name
+
+    def refill(self):
+        with self._lock:
+            if self._refilling or self.size <= 0:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, daemon=True).start()
+
+    def _refill(self):
+        try:
+            # Bounded so an upstream returning junk cannot spin forever
+            for _ in range(2 * self.size):
+                if len(self._names) >= self.size:
+                    break
+                name = self.generate()
+                if name.strip():
+                    self._names.append(name)
+        except Exception as e:
+            logger.exception(f"Slop refill failed: {e}")
+        finally:
+            with self._lock:
+                self._refilling = False
+
+
+slop_pool = NamePool(generate_name, settings.SLOP_BUFFER_SIZE, settings.SLOP_REFILL_AT)
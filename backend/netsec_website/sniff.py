@@ -0,0 +1,32 @@
+# python
+import threading
+
+ALLOWED_MIME_TYPES = ('image/jpeg', 'image/png')
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# SOI marker followed by the start of the next marker
+JPEG_SIGNATURE = b'\xff\xd8\xff'
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def get_detector():
+    # magic.Magic loads the libmagic database on construction, so build it
+    # once per process. Magic.from_buffer serializes calls with its own lock.
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                # Deferred so only non JPEG/PNG input pays for loading libmagic
+                import magic
+                _detector = magic.Magic(mime=True)
+    return _detector
+
+
+def sniff_mime(file_data):
+    # Same MIME strings libmagic reports for these signatures
+    if file_data.startswith(PNG_SIGNATURE):
+        return 'image/png'
+    if file_data.startswith(JPEG_SIGNATURE):
+        return 'image/jpeg'
+    return get_detector().from_buffer(file_data)
@@ -0,0 +1,154 @@
+# django
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+#api
+from api.models import Upload_Job, Picture_Blob, Profile_Picture
+from .feed_cache import feed_cache
+from .instrumentation import track_outbound
+# python
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import hashlib
+import threading
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+# PROCESSING jobs older than this were owned by a worker that died
+STALE_AFTER = timedelta(minutes=5)
+
+_executor = None
+_lock = threading.Lock()
+_inflight = set()
+_resumed = False
+
+
+def get_executor():
+    # Pillow releases the GIL while decoding and resizing, so threads spread
+    # the image work across cores without a separate process pool.
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.UPLOAD_WORKERS,
+                    thread_name_prefix="upload",
+                )
+    return _executor
+
+
+def enqueue(user, file_data):
+    job = Upload_Job(user=user, data=file_data)
+    job.save()
+    resume_pending()
+    submit(job.id)
+    return job
+
+
+def submit(job_id):
+    with _lock:
+        if job_id in _inflight:
+            return
+        _inflight.add(job_id)
+    get_executor().submit(run_job, job_id)
+
+
+def run_job(job_id):
+    close_old_connections()
+    try:
+        process_job(job_id)
+    except Exception as e:
+        logger.exception(f"Upload job {job_id} crashed: {e}")
+    finally:
+        with _lock:
+            _inflight.discard(job_id)
+        close_old_connections()
+
+
+def process_job(job_id):
+    # Claiming with a conditional UPDATE keeps two workers off the same job
+    claimed = Upload_Job.objects.filter(id=job_id, status=Upload_Job.PENDING).update(
+        status=Upload_Job.PROCESSING,
+        updated_at=timezone.now(),
+    )
+    if not claimed:
+        return
+    job = Upload_Job.objects.only('id', 'user_id', 'data').get(id=job_id)
+    # Pillow and libmagic are only loaded by processes that handle uploads
+    from .images import sanitize_picture
+    try:
+        png_data = sanitize_picture(bytes(job.data))
+        if png_data is None:
+            finish_job(job_id, Upload_Job.FAILED, "Invalid file")
+            return
+        set_profile_picture(job.user_id, store_picture(png_data))
+        feed_cache.invalidate()
+    except Exception as e:
+        logger.exception(f"Image upload failed: {e}")
+        finish_job(job_id, Upload_Job.FAILED, "Image upload failed")
+        return
+    finish_job(job_id, Upload_Job.DONE)
+
+
+def set_profile_picture(user_id, url):
+    # One upsert, url comes from a full_clean()ed Picture_Blob row
+    Profile_Picture.objects.bulk_create(
+        [Profile_Picture(user_id=user_id, profile_picture=url)],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['profile_picture'],
+    )
+
+
+def finish_job(job_id, status, error=''):
+    Upload_Job.objects.filter(id=job_id).update(
+        status=status,
+        error=error,
+        data=None,
+        updated_at=timezone.now(),
+    )
+
+
+def store_picture(png_data):
+    # Identical pictures share one blob, only new content is uploaded.
+    # Reusing a blob touches last_used_at in the same UPDATE that finds it:
+    # gc_picture_blobs only deletes rows idle for its grace window, checked
+    # again under a row lock, so a touched blob survives until it is linked.
+    import vercel_blob
+    content_hash = hashlib.sha256(png_data).hexdigest()
+    blobs = Picture_Blob.objects.filter(content_hash=content_hash)
+    if blobs.update(last_used_at=timezone.now()):
+        return blobs.values_list('url', flat=True).get()
+    with track_outbound("blob"):
+        uploaded_file = vercel_blob.put(f'{content_hash}', png_data, {})
+    picture_blob = Picture_Blob(content_hash=content_hash, url=uploaded_file['downloadUrl'])
+    # The unique index settles races, validate_unique would turn losing one
+    # into a ValidationError before the insert is even tried
+    picture_blob.full_clean(validate_unique=False)
+    Picture_Blob.objects.bulk_create([picture_blob], ignore_conflicts=True)
+    url = blobs.values_list('url', flat=True).get()
+    if url != picture_blob.url:
+        # Lost a race with the same upload, keep theirs and drop ours
+        with track_outbound("blob"):
+            vercel_blob.delete(picture_blob.url)
+    return url
+
+
+def requeue_stale(jobs):
+    # Conditional UPDATE, so only one caller gets a stale job back to PENDING
+    return jobs.filter(
+        status=Upload_Job.PROCESSING,
+        updated_at__lt=timezone.now() - STALE_AFTER,
+    ).update(status=Upload_Job.PENDING)
+
+
+def resume_pending(force=False):
+    # Picks up jobs left behind by a restart, once per process
+    global _resumed
+    if _resumed and not force:
+        return
+    _resumed = True
+    requeue_stale(Upload_Job.objects.all())
+    for job_id in Upload_Job.objects.filter(status=Upload_Job.PENDING).values_list('id', flat=True):
+        submit(job_id)
@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react';
 import nyom from './assets/nyom.png'; 
 import './App.css';
-import { login, logout, register, checkSession, getMessages, sendMessage, uploadProfilePicture, deleteMessage, aiSlop } from './api.js';
+import { login, logout, register, checkSession, getMessages, subscribeMessages, sendMessage, uploadProfilePicture, waitForUpload, deleteMessage, aiSlop } from './api.js';
 
 
 function Header({ setPage, isAuthenticated }) {
@@ -59,27 +59,66 @@ function MessageBlock({author, content, profile_picture_url, messageId, messageU
   )
 }
 
+const PAGE_SIZE = 50;
+
 function Chat({isAuthenticated, username}) {
   const [messages, setMessages] = useState([]);
   const [input, setInput] = useState('');
-  const [reload, setReload] = useState(false);
+  const [hasOlder, setHasOlder] = useState(false);
 
   useEffect(() => {
     async function fetchMessages() {
-      const sessionResponse = await checkSession();
-      if (sessionResponse.error) {
+      // App already checked the session, no need for a second round-trip
+      if (!isAuthenticated) {
         setMessages([]);
         return;
       }
-      const response = await getMessages();
+      const response = await getMessages({ limit: PAGE_SIZE });
       if (response.error) {
         setMessages([]);
         return;
       }
       setMessages(response);
+      setHasOlder(response.length === PAGE_SIZE);
     }
     fetchMessages();
-  }, [reload]);
+  }, [isAuthenticated]);
+
+  useEffect(() => {
+    if (!isAuthenticated) {
+      return;
+    }
+    return subscribeMessages(
+      (created) => setMessages(current => current.some(msg => msg.id === created.id) ? current : current.concat([created])),
+      (uuid) => setMessages(current => current.filter(msg => msg.uuid !== uuid)),
+    );
+  }, [isAuthenticated]);
+
+  // Pull only the messages newer than the last one we already have
+  async function fetchNewer() {
+    const last = messages.length ? messages[messages.length - 1].id : undefined;
+    const response = await getMessages(last === undefined ? { limit: PAGE_SIZE } : { after: last, limit: PAGE_SIZE });
+    if (response.error) {
+      return;
+    }
+    setMessages(current => {
+      const known = new Set(current.map(msg => msg.id));
+      return current.concat(response.filter(msg => !known.has(msg.id)));
+    });
+  }
+
+  async function handleLoadOlder() {
+    if (!messages.length) {
+      return;
+    }
+    const response = await getMessages({ before: messages[0].id, limit: PAGE_SIZE });
+    if (response.error) {
+      alert("Failed to load messages: " + response.error);
+      return;
+    }
+    setMessages(current => response.concat(current));
+    setHasOlder(response.length === PAGE_SIZE);
+  }
 
   async function handleSendMessage() {
     if (input.trim()) {
@@ -89,7 +128,7 @@ function Chat({isAuthenticated, username}) {
         return;
       }
       setInput('');
-      setReload(!reload);
+      fetchNewer();
     }
   }
 
@@ -100,7 +139,7 @@ function Chat({isAuthenticated, username}) {
       alert("Failed to delete message: " + response.error);
       return;
     }
-    setReload(!reload);
+    setMessages(current => current.filter(msg => msg.uuid !== messageUuid));
   }
 
   return (
@@ -109,9 +148,9 @@ function Chat({isAuthenticated, username}) {
         {isAuthenticated ? (
           <>
             <div className="messages">
-              {messages.slice().reverse().map((msg, index) => (
+              {messages.slice().reverse().map((msg) => (
                 <MessageBlock 
-                  key={index}
+                  key={msg.uuid}
                   author={msg.author} 
                   content={msg.content} 
                   profile_picture_url={msg.profile_picture} 
@@ -121,6 +160,9 @@ function Chat({isAuthenticated, username}) {
                   onDelete={handleDeleteMessage} 
                 />
               ))}
+              {hasOlder && (
+                <button className="delete_button" onClick={handleLoadOlder}>Load older</button>
+              )}
             </div>
             <div className='panel no_bob' id="input_panel">
               <div id="input">
@@ -179,6 +221,11 @@ function Profile() {
       alert("Failed to upload profile picture: " + response.error);
       return;
     }
+    const result = await waitForUpload(response.job_id);
+    if (result.error) {
+      alert("Failed to upload profile picture: " + result.error);
+      return;
+    }
 
     alert("Profile picture changed successfully!");
     setSelectedFile(null);
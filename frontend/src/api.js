@@ -1,11 +1,36 @@
 // export const API_URL = "http://fakelocal.api:8000/api";
 export const API_URL = "/api";
 
+// Django's csrftoken cookie, planted by /session on page load and rotated by
+// login and logout. /csrf is only asked when the cookie is missing.
+let heldCSRFToken = null;
+
+function readCSRFCookie() {
+    const match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+    return match ? decodeURIComponent(match[1]) : null;
+}
+
+// Login and logout send the rotated token back as a header too
+function rememberCSRFToken(response) {
+    const token = response.headers.get("X-CSRFToken");
+    if (token) {
+        heldCSRFToken = token;
+    }
+}
+
 export async function getCSRFToken() {
+    const cookie = readCSRFCookie();
+    if (cookie) {
+        return cookie;
+    }
+    if (heldCSRFToken) {
+        return heldCSRFToken;
+    }
     try {
         const response = await fetch(`${API_URL}/csrf`, { credentials: "include" });
         if (response.ok) {
             const data = await response.json();
+            heldCSRFToken = data.csrfToken;
             return data.csrfToken;
         } else {
             console.error("Failed to fetch CSRF token:", response.statusText);
@@ -17,6 +42,35 @@ export async function getCSRFToken() {
     }
 }
 
+// Last ETag and body per URL. They are sent back as If-None-Match and a
+// 304 Not Modified is answered from here without a new body.
+const MAX_VALIDATORS = 50;
+const validators = new Map();
+
+async function conditionalGet(url) {
+    const held = validators.get(url);
+    const response = await fetch(url, {
+        credentials: "include",
+        // The validators are handled here, keep the HTTP cache out of it
+        cache: "no-store",
+        headers: held ? { "If-None-Match": held.etag } : {},
+    });
+
+    if (response.status === 304 && held) {
+        return { ok: true, data: held.data };
+    }
+    const data = await response.json();
+    validators.delete(url);
+    const etag = response.headers.get("ETag");
+    if (response.ok && etag) {
+        validators.set(url, { etag, data });
+        if (validators.size > MAX_VALIDATORS) {
+            validators.delete(validators.keys().next().value);
+        }
+    }
+    return { ok: response.ok, data };
+}
+
 export async function register(username, password) {
     try {
         const csrfToken = await getCSRFToken(); // Fetch the CSRF token
@@ -65,6 +119,7 @@ export async function login(username, password) {
             credentials: "include",
             body: JSON.stringify({ username, password }),
         });
+        rememberCSRFToken(response);
 
         if (response.ok) {
             return await response.json();
@@ -96,6 +151,7 @@ export async function logout() {
             },
             credentials: "include",
         });
+        rememberCSRFToken(response);
 
         if (response.ok) {
             return await response.json();
@@ -114,23 +170,12 @@ export async function logout() {
 
 export async function checkSession() {
     try {
-        const csrfToken = await getCSRFToken(); // Fetch the CSRF token
-        if (csrfToken.error) {
-            return { error: csrfToken.error };
-        }
-
-        const response = await fetch(`${API_URL}/session`, {
-            method: "GET",
-            credentials: "include",
-            headers: {
-                "X-CSRFToken": csrfToken
-            }
-        });
+        const response = await conditionalGet(`${API_URL}/session`);
 
         if (response.ok) {
-            return await response.json();
+            return response.data;
         } else {
-            const error = await response.json();
+            const error = response.data;
             if (error.details === undefined) {
                 return { error: "error" };
             }
@@ -142,24 +187,21 @@ export async function checkSession() {
     }
 }
 
-export async function getMessages() {
+// before / after are Message ids; after returns only messages newer than it
+export async function getMessages({ limit, before, after } = {}) {
     try {
-        const csrfToken = await getCSRFToken(); // Fetch the CSRF token
-        if (csrfToken.error) {
-            return { error: csrfToken.error };
-        }
+        const params = new URLSearchParams();
+        if (limit !== undefined) params.set("limit", limit);
+        if (before !== undefined) params.set("before", before);
+        if (after !== undefined) params.set("after", after);
+        const query = params.toString() ? `?${params}` : "";
 
-        const response = await fetch(`${API_URL}/message`, { 
-            credentials: "include", 
-            headers: {
-                "X-CSRFToken": csrfToken
-            }
-        });
+        const response = await conditionalGet(`${API_URL}/message${query}`);
 
         if (response.ok) {
-            return await response.json();
+            return response.data;
         } else {
-            const error = await response.json();
+            const error = response.data;
             if (error.details === undefined) {
                 return { error: "error" };
             }
@@ -171,6 +213,30 @@ export async function getMessages() {
     }
 }
 
+// The first subscription is the probe: a WSGI deployment answers /events with
+// 501, EventSource closes for good, and the page stays on fetch-after-write
+// without asking again.
+let eventsUnavailable = false;
+
+// Server-Sent Events feed deltas, returns a function that closes the stream
+export function subscribeMessages(onCreated, onDeleted) {
+    if (eventsUnavailable) {
+        return () => {};
+    }
+    const source = new EventSource(`${API_URL}/events`, { withCredentials: true });
+    let opened = false;
+    source.onopen = () => { opened = true; };
+    source.addEventListener("message_created", (event) => onCreated(JSON.parse(event.data)));
+    source.addEventListener("message_deleted", (event) => onDeleted(JSON.parse(event.data).uuid));
+    source.onerror = () => {
+        // Closed before it ever opened: not served here, don't try again
+        if (source.readyState === EventSource.CLOSED && !opened) {
+            eventsUnavailable = true;
+        }
+    };
+    return () => source.close();
+}
+
 export async function sendMessage(content) {
     try {
         const csrfToken = await getCSRFToken(); // Fetch the CSRF token
@@ -267,20 +333,50 @@ export async function uploadProfilePicture(file) {
     }
 }
 
-
-export async function aiSlop(){
+export async function getUploadStatus(jobId) {
     try {
-        const csrfToken = await getCSRFToken(); // Fetch the CSRF token
-        if (csrfToken.error) {
-            return { error: csrfToken.error };
+        const response = await fetch(`${API_URL}/upload/${jobId}`, {
+            credentials: "include",
+        });
+
+        if (response.ok) {
+            return await response.json();
+        } else {
+            const error = await response.json();
+            if (error.details === undefined) {
+                return { error: "error" };
+            }
+            return { error: error.details };
         }
+    } catch (error) {
+        console.error("Error checking upload status:", error);
+        return { error: "Network error" };
+    }
+}
 
+// Uploads are processed in the background, poll until the job settles
+export async function waitForUpload(jobId, { interval = 500, attempts = 40 } = {}) {
+    for (let i = 0; i < attempts; i++) {
+        const status = await getUploadStatus(jobId);
+        if (status.error) {
+            return status;
+        }
+        if (status.status === "done") {
+            return status;
+        }
+        if (status.status === "failed") {
+            return { error: status.details || "Image upload failed" };
+        }
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+    return { error: "Upload is still processing" };
+}
+
+
+export async function aiSlop(){
+    try {
         const response = await fetch(`${API_URL}/ai_slop`, {
             method: "GET",
-            headers: { 
-                "Content-Type": "application/json",
-                "X-CSRFToken": csrfToken
-            },
             credentials: "include",
         });
 